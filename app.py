@@ -4,36 +4,59 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from scripts import (
-    load_model,
-    find_optimal_price,
     predict_revenue,
     analyze_discount,
-    calculate_adjustment,
+    adjustment_records,
+    discount_scenarios,
     plot_price_quantity,
     plot_discount_impact,
-    plot_elasticity_factors
+    plot_elasticity_factors,
+    plot_profit_risk,
+    risk_portfolio,
+    risk_profile,
+    rolling_elasticity,
+    plot_rolling_elasticity
 )
-from scripts.CSV import load_data
+from scripts.rolling import DEFAULT_STEP_DAYS, DEFAULT_WINDOW_DAYS, MIN_WINDOW_OBSERVATIONS
+from scripts.service import DataService
+from scripts import metrics
+from scripts.cache import FIGURE_MAXSIZE, LRUCache, cached_combo, cached_portfolio
 # Thiết lập cấu hình Streamlit
 st.set_page_config(page_title="Tối ưu hóa Giá Quán Cà Phê", layout="wide")
 
-# Tải dữ liệu và mô hình
-@st.cache_data
-def get_data_and_models():
-    combined_data, bau2_data = load_data()
-    models = {
-        'burger_1070': load_model('models/burger_1070.pkl'),
-        'burger_2051': load_model('models/burger_2051.pkl'),
-        'burger_2052': load_model('models/burger_2052.pkl'),
-        'burger_2053': load_model('models/burger_2053.pkl'),
-        'coke_2051': load_model('models/coke_2051.pkl'),
-        'coke_2053': load_model('models/coke_2053.pkl'),
-        'lemonade_2052': load_model('models/lemonade_2052.pkl'),
-        'coffee_2053': load_model('models/coffee_2053.pkl')
-    }
-    return combined_data, bau2_data, models
+# Tải dữ liệu và mô hình: một bản dùng chung cho mọi phiên của tiến trình (không sao chép mỗi lần
+# rerun); tự nạp lại khi file nguồn hoặc phiên bản mô hình trong models/manifest.json thay đổi
+@st.cache_resource
+def get_service():
+    return DataService(typed=True)
 
-combined_data, bau2_data, models = get_data_and_models()
+# Bộ đệm LRU dùng chung cho mọi phiên: kết quả tính toán và biểu đồ
+@st.cache_resource
+def get_caches():
+    return {'results': LRUCache(), 'figures': LRUCache(FIGURE_MAXSIZE)}
+
+state = get_service().refresh()
+combined_index, bau2_index, models = state.combined_index, state.bau2_index, state.models
+cubes, fingerprints = state.cubes, state.fingerprints
+combined_data = combined_index.data
+caches = get_caches()
+
+def show_segment_fit(segment_fit):
+    # Hồi quy QUANTITY ~ PRICE trên đúng tập dữ liệu đã lọc, lấy từ khối thống kê
+    st.write(f"**Số ngày dữ liệu**: {segment_fit['n']} – **Hệ số giá**: {segment_fit['slope']:.2f} – "
+             f"**Độ co giãn tại giá trung bình**: {segment_fit['elasticity']:.2f}")
+
+def modeled_catalog(index):
+    # Danh mục lẻ/combo lấy từ dữ liệu nhưng chỉ giữ sản phẩm có mô hình trong registry hiện tại
+    # (SELL_ID mới ít dữ liệu hoặc chưa huấn luyện lại thì chưa có); combo thiếu một món bị bỏ cả combo
+    single_products = [key for key in index.single_products if key in models]
+    combos = {sell_id: items for sell_id, items in index.combos.items()
+              if all(f"{item.lower()}_{sell_id}" in models for item in items)}
+    missing = [key for key in index.keys() if key not in models]
+    if missing:
+        st.warning(f"Chưa có mô hình cho {len(missing)} sản phẩm (bỏ qua): {', '.join(missing)}. "
+                   "Chạy lại `python -m scripts.train` để bổ sung.")
+    return single_products, combos
 
 # Sidebar
 st.sidebar.title("Điều hướng")
@@ -49,100 +72,96 @@ page = st.sidebar.radio("Chọn chức năng", [
 if page == "Giá tối ưu":
     st.title("Giá Tối ưu cho Từng Sản phẩm và Combo")
     
-    # Nhóm sản phẩm thành combo dựa trên SELL_ID
-    sell_ids = combined_data['SELL_ID'].unique()
-    single_products = []
-    combos = {}
+    # Nhóm sản phẩm thành combo dựa trên SELL_ID (danh mục dựng sẵn trong chỉ mục)
+    single_products, combos = modeled_catalog(combined_index)
     
-    for sell_id in sell_ids:
-        # Lấy dữ liệu cho SELL_ID
-        sell_data = combined_data[combined_data['SELL_ID'] == sell_id]
-        items = sell_data['ITEM_NAME'].unique()
-        if len(items) > 1:  # Nếu có nhiều hơn 1 sản phẩm, là combo
-            combos[sell_id] = list(items)
-        else:  # Nếu chỉ có 1 sản phẩm, là bán lẻ
-            single_products.append(f"{items[0].lower()}_{sell_id}")
-    
-    # Hiển thị sản phẩm bán lẻ
+    # Nhập giá mua cho toàn bộ sản phẩm rồi tối ưu tất cả trong một lần
+    buying_prices = {}
     st.subheader("Sản phẩm bán lẻ")
+    for product in single_products:
+        buying_prices[product] = st.number_input(f"Nhập giá mua cho {product}", min_value=0.0, value=9.0, step=0.1, key=f"buying_price_{product}")
+    single_table = st.empty()
+
+    st.subheader("Combo")
+    max_totals = {}
+    for sell_id, items in combos.items():
+        for item in items:
+            product_key = f"{item.lower()}_{sell_id}"
+            buying_prices[product_key] = st.number_input(f"Nhập giá mua cho {product_key} trong combo {sell_id}", 
+                                                        min_value=0.0, value=9.0, step=0.1, key=f"buying_price_{product_key}")
+        max_totals[sell_id] = st.number_input(f"Giới hạn tổng giá combo {sell_id} (0 = không giới hạn)",
+                                              min_value=0.0, value=0.0, step=0.5, key=f"max_total_{sell_id}")
+    combo_table = st.empty()
+
+    # Chỉ sản phẩm có giá mua thay đổi mới được tính lại, phần còn lại lấy từ bộ đệm
+    portfolio = cached_portfolio(caches['results'], fingerprints['combined'], combined_data,
+                                 {product: models[product] for product in single_products},
+                                 buying_prices).set_index('PRODUCT')
+
+    # Hiển thị sản phẩm bán lẻ
     single_results = []
     for product in single_products:
-        buying_price = st.number_input(f"Nhập giá mua cho {product}", min_value=0.0, value=9.0, step=0.1, key=f"buying_price_{product}")
-        product_data = combined_data[(combined_data['ITEM_NAME'] == product.split('_')[0].upper()) & 
-                                    (combined_data['SELL_ID'] == int(product.split('_')[1]))]
-        result = find_optimal_price(product_data, models[product], buying_price)
+        result = portfolio.loc[product]
         single_results.append({
             'Sản phẩm': product,
-            'Giá tối ưu': round(result['PRICE'].iloc[0], 2),
-            'Số lượng dự đoán': round(result['QUANTITY'].iloc[0], 2),
-            'Lợi nhuận tối đa': round(result['PROFIT'].iloc[0], 2)
+            'Giá tối ưu': round(result['PRICE'], 2),
+            'Số lượng dự đoán': round(result['QUANTITY'], 2),
+            'Lợi nhuận tối đa': round(result['PROFIT'], 2)
         })
-    st.table(pd.DataFrame(single_results))
+    single_table.table(pd.DataFrame(single_results))
     
-    # Hiển thị combo
-    st.subheader("Combo")
+    # Hiển thị combo: tối ưu đồng thời giá các sản phẩm trong combo (có thể giới hạn tổng giá)
     combo_results = []
     for sell_id, items in combos.items():
-        # Nhập giá mua cho từng sản phẩm trong combo
-        buying_prices = {}
-        for item in items:
-            product_key = f"{item.lower()}_{sell_id}"
-            buying_prices[product_key] = st.number_input(f"Nhập giá mua cho {product_key} trong combo {sell_id}", 
-                                                        min_value=0.0, value=9.0, step=0.1, key=f"buying_price_{product_key}")
-        
-        # Tính giá tối ưu và lợi nhuận cho combo
-        total_price = 0
-        total_quantity = 0
-        total_profit = 0
-        for item in items:
-            product_key = f"{item.lower()}_{sell_id}"
-            product_data = combined_data[(combined_data['ITEM_NAME'] == item.upper()) & 
-                                        (combined_data['SELL_ID'] == sell_id)]
-            result = find_optimal_price(product_data, models[product_key], buying_prices[product_key])
-            total_price += result['PRICE'].iloc[0]
-            total_quantity += result['QUANTITY'].iloc[0]
-            total_profit += result['PROFIT'].iloc[0]
-        
+        combo_models = {f"{item.lower()}_{sell_id}": models[f"{item.lower()}_{sell_id}"] for item in items}
+        try:
+            result = cached_combo(caches['results'], fingerprints['combined'], combo_models, buying_prices,
+                                  max_total=max_totals[sell_id] or None, data=combined_index)
+        except ValueError as error:
+            st.warning(f"Combo {sell_id}: {error}")
+            continue
         combo_results.append({
             'Combo': f"Combo {sell_id}: {', '.join(items)}",
-            'Tổng giá tối ưu': round(total_price, 2),
-            'Tổng số lượng dự đoán': round(total_quantity, 2),
-            'Tổng lợi nhuận tối đa': round(total_profit, 2)
+            'Tổng giá tối ưu': round(result['PRICE'].sum(), 2),
+            'Tổng số lượng dự đoán': round(result['QUANTITY'].sum(), 2),
+            'Tổng lợi nhuận tối đa': round(result['PROFIT'].sum(), 2)
         })
-    st.table(pd.DataFrame(combo_results))
+    combo_table.table(pd.DataFrame(combo_results))
 
 # Trang 2: Phân tích giá
 elif page == "Phân tích giá":
     st.title("Phân tích Tác động của Giá đến Doanh thu")
     data_choice = st.radio("Chọn dữ liệu", ["Toàn bộ dữ liệu (combined_data)", "Dữ liệu ngày thường (bau2_data)"])
-    data_to_use = combined_data if data_choice == "Toàn bộ dữ liệu (combined_data)" else bau2_data
+    index_to_use = combined_index if data_choice == "Toàn bộ dữ liệu (combined_data)" else bau2_index
+    cube_to_use = cubes['combined'] if data_choice == "Toàn bộ dữ liệu (combined_data)" else cubes['bau2']
+    fingerprint = fingerprints['combined'] if data_choice == "Toàn bộ dữ liệu (combined_data)" else fingerprints['bau2']
     
     product = st.selectbox("Chọn sản phẩm", list(models.keys()))
-    product_data = data_to_use[(data_to_use['ITEM_NAME'] == product.split('_')[0].upper()) & 
-                              (data_to_use['SELL_ID'] == int(product.split('_')[1]))]
     
     # Bộ lọc bổ sung
     st.subheader("Bộ lọc dữ liệu")
-    holidays = ['Tất cả'] + list(data_to_use['HOLIDAY'].unique())
+    holidays = ['Tất cả'] + index_to_use.holidays
     holiday_filter = st.selectbox("Lọc theo ngày lễ", holidays)
     weekend_filter = st.selectbox("Lọc theo cuối tuần", ['Tất cả', 'Có', 'Không'])
     schoolbreak_filter = st.selectbox("Lọc theo kỳ nghỉ học", ['Tất cả', 'Có', 'Không'])
     
-    filtered_data = product_data.copy()
-    if holiday_filter != 'Tất cả':
-        filtered_data = filtered_data[filtered_data['HOLIDAY'] == holiday_filter]
-    if weekend_filter != 'Tất cả':
-        filtered_data = filtered_data[filtered_data['IS_WEEKEND'] == (1 if weekend_filter == 'Có' else 0)]
-    if schoolbreak_filter != 'Tất cả':
-        filtered_data = filtered_data[filtered_data['IS_SCHOOLBREAK'] == (1 if schoolbreak_filter == 'Có' else 0)]
+    # Cộng các ô của khối thống kê theo bộ lọc; dữ liệu thô chỉ lấy từ chỉ mục khi cần vẽ
+    filters = dict(
+        holiday=None if holiday_filter == 'Tất cả' else holiday_filter,
+        weekend=None if weekend_filter == 'Tất cả' else int(weekend_filter == 'Có'),
+        schoolbreak=None if schoolbreak_filter == 'Tất cả' else int(schoolbreak_filter == 'Có')
+    )
+    segment_fit = cube_to_use.query(product, **filters) if product in cube_to_use else None
     
-    if filtered_data.empty:
+    if segment_fit is None or segment_fit['n'] == 0:
         st.warning("Không có dữ liệu sau khi áp dụng bộ lọc. Vui lòng thay đổi bộ lọc.")
     else:
         test_price = st.slider("Chọn giá thử nghiệm", 
-                              min_value=float(filtered_data['PRICE'].min()),
-                              max_value=float(filtered_data['PRICE'].max()),
-                              value=float(filtered_data['PRICE'].mean()))
+                              min_value=segment_fit['min_price'],
+                              max_value=segment_fit['max_price'],
+                              value=segment_fit['mean_price'])
+        show_segment_fit(segment_fit)
+        filtered_data = index_to_use.segment(product, **filters)
         
         revenue, quantity = predict_revenue(filtered_data, models[product], test_price)
         
@@ -150,9 +169,25 @@ elif page == "Phân tích giá":
         st.write(f"**Số lượng dự đoán**: {quantity:.2f}")
         st.write(f"**Doanh thu dự đoán**: {revenue:.2f}")
         
-        # Vẽ biểu đồ
-        fig = plot_price_quantity(filtered_data, models[product])
+        # Vẽ biểu đồ (đệm theo sản phẩm, phân khúc và bộ lọc)
+        fig = caches['figures'].get_or_compute(
+            ('plot_price_quantity', product, fingerprint, tuple(filters.items())),
+            plot_price_quantity, filtered_data, models[product])
         st.plotly_chart(fig)
+        
+        # Mô phỏng Monte Carlo theo độ bất định của hệ số hồi quy (ma trận hiệp phương sai của mô hình)
+        with st.expander("Rủi ro lợi nhuận (Monte Carlo)"):
+            risk_buying_price = st.number_input("Giá mua", min_value=0.0, value=9.0, step=0.1, key="risk_buying_price")
+            profile = caches['results'].get_or_compute(
+                ('risk_profile', product, fingerprint, tuple(filters.items()), risk_buying_price),
+                risk_profile, filtered_data, models[product], risk_buying_price)
+            expected = profile.loc[profile['EXPECTED_PROFIT'].idxmax()]
+            safe = profile.loc[profile['PROFIT_Q05'].idxmax()]
+            st.write(f"**Giá tối đa lợi nhuận kỳ vọng**: {expected['PRICE']:.2f} "
+                     f"(kỳ vọng {expected['EXPECTED_PROFIT']:.2f}, xác suất lỗ {expected['PROB_LOSS']:.1%})")
+            st.write(f"**Giá điều chỉnh theo rủi ro** (tối đa lợi nhuận đạt được với xác suất 95%): {safe['PRICE']:.2f} "
+                     f"(kỳ vọng {safe['EXPECTED_PROFIT']:.2f}, phân vị 5% {safe['PROFIT_Q05']:.2f})")
+            st.plotly_chart(plot_profit_risk(profile))
 
 
 # Trang 3: Khuyến mãi
@@ -162,17 +197,34 @@ elif page == "Khuyến mãi":
     discount_percent = st.slider("Mức giảm giá (%)", min_value=0, max_value=50, value=10)
     buying_price = st.number_input("Nhập giá mua", min_value=0.0, value=9.0, step=0.1)
     
-    product_data = combined_data[(combined_data['ITEM_NAME'] == product.split('_')[0].upper()) & 
-                                (combined_data['SELL_ID'] == int(product.split('_')[1]))]
-    result = analyze_discount(product_data, models[product], discount_percent, buying_price)
+    product_data = combined_index.product(product)
+    result = caches['results'].get_or_compute(
+        ('analyze_discount', product, fingerprints['combined'], buying_price, discount_percent),
+        analyze_discount, product_data, models[product], discount_percent, buying_price)
     
     st.write(f"**Giá sau giảm {discount_percent}%**: {result['discounted_price']:.2f}")
     st.write(f"**Số lượng dự đoán**: {result['quantity']:.2f}")
     st.write(f"**Lợi nhuận dự đoán**: {result['profit']:.2f}")
     
+    # Quét mọi mức giảm giá 0-50% trong một lần tính để tìm mức có lợi nhuận cao nhất
+    sweep = caches['results'].get_or_compute(
+        ('discount_sweep', product, fingerprints['combined'], buying_price),
+        discount_scenarios, product_data, {product: models[product]}, np.arange(0, 51), buying_price)
+    best = sweep.loc[sweep['PROFIT'].idxmax()]
+    st.write(f"**Mức giảm giá có lợi nhuận cao nhất**: {best['DISCOUNT']:.0f}% "
+             f"(lợi nhuận {best['PROFIT']:.2f})")
+    
     # Vẽ biểu đồ
-    fig = plot_discount_impact(product_data, models[product], buying_price)
+    fig = caches['figures'].get_or_compute(
+        ('plot_discount_impact', product, fingerprints['combined'], (), buying_price),
+        plot_discount_impact, product_data, models[product], buying_price)
     st.plotly_chart(fig)
+    
+    with st.expander("Lợi nhuận theo mức giảm giá cho mọi sản phẩm (cùng giá mua)"):
+        all_products = caches['results'].get_or_compute(
+            ('discount_scenarios', fingerprints['combined'], buying_price),
+            discount_scenarios, combined_index, models, np.arange(0, 51, 5), buying_price)
+        st.dataframe(all_products.pivot(index='PRODUCT', columns='DISCOUNT', values='PROFIT').round(2))
 
 # Trang 4: Đề xuất điều chỉnh giá
 # Trang 4: Đề xuất điều chỉnh giá (phiên bản có nút bấm)
@@ -180,17 +232,7 @@ elif page == "Đề xuất điều chỉnh giá":
     st.title("Đề xuất Điều chỉnh Giá")
 
     # === 1. Phân loại như Trang 1 ===
-    sell_ids = combined_data['SELL_ID'].unique()
-    single_products = []
-    combos = {}
-
-    for sell_id in sell_ids:
-        sell_data = combined_data[combined_data['SELL_ID'] == sell_id]
-        items = sell_data['ITEM_NAME'].unique()
-        if len(items) > 1:
-            combos[sell_id] = list(items)
-        else:
-            single_products.append(f"{items[0].lower()}_{sell_id}")
+    single_products, combos = modeled_catalog(combined_index)
 
     # Biến lưu giá mua (dùng chung cho cả lẻ & combo)
     buying_prices = {}
@@ -217,50 +259,33 @@ elif page == "Đề xuất điều chỉnh giá":
 
     # === 4. Nút bấm kích hoạt tính ===
     if st.button("🔍 Đề xuất giá", key="calc_adjust"):
+        portfolio = cached_portfolio(caches['results'], fingerprints['combined'], combined_data, models,
+                                     buying_prices).set_index('PRODUCT', drop=False)
+
         # ----- 4a. Sản phẩm lẻ -----
-        single_recs = []
-        for product_key in single_products:
-            item_name = product_key.split('_')[0].upper()
-            sell_id = int(product_key.split('_')[1])
-            data_slice = combined_data[
-                (combined_data['ITEM_NAME'] == item_name) &
-                (combined_data['SELL_ID'] == sell_id)
-            ]
-            if data_slice.empty:
-                continue
-            rec = calculate_adjustment(
-                data_slice,
-                models[product_key],
-                buying_prices[product_key],
-                product_key
-            )
-            single_recs.append(rec)
+        single_recs = adjustment_records(portfolio.loc[single_products])
 
         st.subheader("Kết quả – Sản phẩm bán lẻ")
         st.table(pd.DataFrame(single_recs))
 
         # ----- 4b. Combo -----
-        combo_recs = []
-        for sell_id, items in combos.items():
-            for item in items:
-                product_key = f"{item.lower()}_{sell_id}"
-                item_name = item.upper()
-                data_slice = combined_data[
-                    (combined_data['ITEM_NAME'] == item_name) &
-                    (combined_data['SELL_ID'] == sell_id)
-                ]
-                if data_slice.empty:
-                    continue
-                rec = calculate_adjustment(
-                    data_slice,
-                    models[product_key],
-                    buying_prices[product_key],
-                    product_key
-                )
-                combo_recs.append(rec)
+        combo_keys = [f"{item.lower()}_{sell_id}" for sell_id, items in combos.items() for item in items]
+        combo_recs = adjustment_records(portfolio.loc[combo_keys])
 
         st.subheader("Kết quả – Combo")
         st.table(pd.DataFrame(combo_recs))
+
+        with st.expander("Giá điều chỉnh theo rủi ro (Monte Carlo, mọi sản phẩm)"):
+            risk = caches['results'].get_or_compute(
+                ('risk_portfolio', fingerprints['combined'], tuple(buying_prices.get(key, 9.0) for key in models)),
+                risk_portfolio, combined_data, models, buying_prices)
+            st.dataframe(risk.rename(columns={
+                'PRODUCT': 'Sản phẩm', 'BUYING_PRICE': 'Giá mua', 'EXPECTED_PRICE': 'Giá tối đa kỳ vọng',
+                'EXPECTED_PRICE_PROFIT': 'Lợi nhuận kỳ vọng tối đa', 'PRICE': 'Giá theo rủi ro',
+                'EXPECTED_QUANTITY': 'Số lượng kỳ vọng', 'EXPECTED_PROFIT': 'Lợi nhuận kỳ vọng',
+                'STD_PROFIT': 'Độ lệch chuẩn lợi nhuận', 'PROB_LOSS': 'Xác suất lỗ', 'PROFIT_Q05': 'Lợi nhuận P5',
+                'PROFIT_Q50': 'Lợi nhuận P50', 'PROFIT_Q95': 'Lợi nhuận P95',
+            }).round(2), hide_index=True)
     else:
         st.info("💡 Nhập xong giá mua rồi bấm **Đề xuất giá** để tính nha!")
 
@@ -268,43 +293,80 @@ elif page == "Đề xuất điều chỉnh giá":
 elif page == "Phân tích bổ sung":
     st.title("Phân tích Bổ sung")
     data_choice = st.radio("Chọn dữ liệu", ["Toàn bộ dữ liệu (combined_data)", "Dữ liệu ngày thường (bau2_data)"])
-    data_to_use = combined_data if data_choice == "Toàn bộ dữ liệu (combined_data)" else bau2_data
+    index_to_use = combined_index if data_choice == "Toàn bộ dữ liệu (combined_data)" else bau2_index
+    cube_to_use = cubes['combined'] if data_choice == "Toàn bộ dữ liệu (combined_data)" else cubes['bau2']
+    fingerprint = fingerprints['combined'] if data_choice == "Toàn bộ dữ liệu (combined_data)" else fingerprints['bau2']
     
     analysis_type = st.selectbox("Chọn loại phân tích", [
         "Mối quan hệ giá-nhu cầu",
         "Tác động của giảm giá",
-        "Yếu tố ảnh hưởng đến độ co giãn giá"
+        "Yếu tố ảnh hưởng đến độ co giãn giá",
+        "Độ co giãn theo thời gian"
     ])
     
     product = st.selectbox("Chọn sản phẩm", list(models.keys()))
-    product_data = data_to_use[(data_to_use['ITEM_NAME'] == product.split('_')[0].upper()) & 
-                              (data_to_use['SELL_ID'] == int(product.split('_')[1]))]
     
     # Bộ lọc bổ sung cho dữ liệu
     st.subheader("Bộ lọc dữ liệu")
-    holidays = ['Tất cả'] + list(data_to_use['HOLIDAY'].unique())
+    holidays = ['Tất cả'] + index_to_use.holidays
     holiday_filter = st.selectbox("Lọc theo ngày lễ", holidays)
     weekend_filter = st.selectbox("Lọc theo cuối tuần", ['Tất cả', 'Có', 'Không'])
     schoolbreak_filter = st.selectbox("Lọc theo kỳ nghỉ học", ['Tất cả', 'Có', 'Không'])
     
-    filtered_data = product_data.copy()
-    if holiday_filter != 'Tất cả':
-        filtered_data = filtered_data[filtered_data['HOLIDAY'] == holiday_filter]
-    if weekend_filter != 'Tất cả':
-        filtered_data = filtered_data[filtered_data['IS_WEEKEND'] == (1 if weekend_filter == 'Có' else 0)]
-    if schoolbreak_filter != 'Tất cả':
-        filtered_data = filtered_data[filtered_data['IS_SCHOOLBREAK'] == (1 if schoolbreak_filter == 'Có' else 0)]
+    # Cộng các ô của khối thống kê theo bộ lọc; dữ liệu thô chỉ lấy từ chỉ mục khi cần vẽ
+    filters = dict(
+        holiday=None if holiday_filter == 'Tất cả' else holiday_filter,
+        weekend=None if weekend_filter == 'Tất cả' else int(weekend_filter == 'Có'),
+        schoolbreak=None if schoolbreak_filter == 'Tất cả' else int(schoolbreak_filter == 'Có')
+    )
+    segment_fit = cube_to_use.query(product, **filters) if product in cube_to_use else None
     
-    if filtered_data.empty:
+    if segment_fit is None or segment_fit['n'] == 0:
         st.warning("Không có dữ liệu sau khi áp dụng bộ lọc. Vui lòng thay đổi bộ lọc.")
     else:
+        show_segment_fit(segment_fit)
+        filtered_data = index_to_use.segment(product, **filters)
+        figure_key = (product, fingerprint, tuple(filters.items()))
         if analysis_type == "Mối quan hệ giá-nhu cầu":
-            fig = plot_price_quantity(filtered_data, models[product])
+            fig = caches['figures'].get_or_compute(('plot_price_quantity',) + figure_key,
+                                                   plot_price_quantity, filtered_data, models[product])
             st.plotly_chart(fig)
         elif analysis_type == "Tác động của giảm giá":
             buying_price = st.number_input("Nhập giá mua", min_value=0.0, value=9.0, step=0.1)
-            fig = plot_discount_impact(filtered_data, models[product], buying_price)
+            fig = caches['figures'].get_or_compute(('plot_discount_impact',) + figure_key + (buying_price,),
+                                                   plot_discount_impact, filtered_data, models[product], buying_price)
             st.plotly_chart(fig)
         elif analysis_type == "Yếu tố ảnh hưởng đến độ co giãn giá":
-            fig = plot_elasticity_factors(data_to_use, product=product)
-            st.plotly_chart(fig)
\ No newline at end of file
+            # Biểu đồ dùng toàn bộ dữ liệu của sản phẩm, không phụ thuộc bộ lọc
+            fig = caches['figures'].get_or_compute(('plot_elasticity_factors', product, fingerprint),
+                                                   plot_elasticity_factors, index_to_use, product=product)
+            st.plotly_chart(fig)
+        elif analysis_type == "Độ co giãn theo thời gian":
+            # Chuỗi cửa sổ trượt tính một lần cho mọi sản phẩm của phân khúc (không phụ thuộc bộ lọc)
+            window_days = st.number_input("Độ dài cửa sổ (ngày)", min_value=7, value=DEFAULT_WINDOW_DAYS, step=1)
+            step_days = st.number_input("Bước trượt (ngày)", min_value=1, value=DEFAULT_STEP_DAYS, step=1)
+            series = caches['results'].get_or_compute(('rolling_elasticity', fingerprint, window_days, step_days),
+                                                      rolling_elasticity, index_to_use, window_days, step_days)
+            fig = caches['figures'].get_or_compute(('plot_rolling_elasticity', product, fingerprint,
+                                                    window_days, step_days),
+                                                   plot_rolling_elasticity, series, product)
+            st.plotly_chart(fig)
+            st.caption(f"Cửa sổ có ít hơn {MIN_WINDOW_OBSERVATIONS} ngày dữ liệu hoặc giá không đổi không có hệ số (để trống).")
+            st.download_button("Tải chuỗi của mọi sản phẩm (CSV)", series.to_csv(index=False),
+                               file_name=f"do_co_gian_{window_days}_{step_days}.csv", mime="text/csv")
+
+# Bảng đo hiệu năng, chỉ hiện khi bật PRICING_METRICS=1 (số liệu cộng dồn trong tiến trình)
+if metrics.is_enabled():
+    with st.sidebar.expander("Đo hiệu năng (debug)"):
+        snapshot = metrics.snapshot()
+        if snapshot:
+            st.dataframe(pd.DataFrame([
+                {'Hàm': name, 'Số lần gọi': metric['calls'], 'Lỗi': metric['errors'], 'Số dòng': metric['rows'],
+                 'Tổng (s)': round(metric['seconds'], 4), 'Trung bình (ms)': round(metric['mean_seconds'] * 1000, 2)}
+                for name, metric in snapshot.items()
+            ]).sort_values('Tổng (s)', ascending=False), hide_index=True)
+        st.write("Bộ đệm:", {name: cache.stats() for name, cache in caches.items()})
+        st.download_button("Tải JSON", metrics.to_json(), file_name="metrics.json", mime="application/json")
+        st.download_button("Tải Prometheus", metrics.to_prometheus(), file_name="metrics.prom", mime="text/plain")
+        if st.button("Xóa số liệu"):
+            metrics.reset()
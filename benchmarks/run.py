@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from scripts import (
+    analyze_discount,
+    calculate_adjustment,
+    discount_scenarios,
+    find_optimal_price,
+    optimize_portfolio,
+    plot_discount_impact,
+    plot_elasticity_factors,
+    plot_price_quantity,
+)
+from scripts.CSV import load_data
+from scripts.products import ProductIndex
+from scripts.registry import load_registry
+
+from .synthetic import generate
+
+# Đo thời gian, bộ nhớ đỉnh và thông lượng của pipeline định giá trên dữ liệu giả:
+#   python -m benchmarks.run --sizes small,medium
+#   python -m benchmarks.run --sizes small --save-baseline      (ghi mốc so sánh)
+# Không cần mạng; dữ liệu sinh vào thư mục tạm.
+SIZES = {
+    'small': dict(n_days=365, n_sell_ids=8, rows_per_day=1, n_items=6),
+    'medium': dict(n_days=730, n_sell_ids=100, rows_per_day=2, n_items=40),
+    'large': dict(n_days=1460, n_sell_ids=1000, rows_per_day=1, n_items=300),
+    'xlarge': dict(n_days=1460, n_sell_ids=2000, rows_per_day=2, n_items=600),
+}
+DISCOUNT_LEVELS = [level / 2 for level in range(101)]
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+
+def measure(fn, units, repeat):
+    # Bộ nhớ đỉnh đo ở lần chạy riêng vì tracemalloc làm chậm phép đo thời gian
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    seconds = min(times)
+    return {'seconds': seconds, 'peak_mb': peak / 2 ** 20, 'units': units,
+            'throughput': units / seconds if seconds > 0 else float('inf')}
+
+
+def run_size(name, params, repeat, max_products, buying_price=9.0):
+    with tempfile.TemporaryDirectory() as directory:
+        rows = generate(directory, **params)
+        combined_data, _ = load_data(directory, use_cache=False)
+        models = load_registry(os.path.join(directory, 'registry.npz'))
+        index = ProductIndex(combined_data)
+        products = [key for key in index.keys() if key in models][:max_products]
+        largest = max(products, key=lambda key: len(index.rows(key)))
+        largest_data = index.product(largest)
+
+        def per_product(fn):
+            return lambda: [fn(index.product(key), models[key]) for key in products]
+
+        benchmarks = {
+            'load_data': (lambda: load_data(directory, use_cache=False), rows),
+            'load_data_cached': (lambda: load_data(directory), rows),
+            'ProductIndex': (lambda: ProductIndex(combined_data), len(combined_data)),
+            'find_optimal_price': (per_product(lambda data, model: find_optimal_price(data, model, buying_price)),
+                                   len(products)),
+            'calculate_adjustment': (per_product(
+                lambda data, model: calculate_adjustment(data, model, buying_price, '')), len(products)),
+            'analyze_discount': (per_product(lambda data, model: analyze_discount(data, model, 10, buying_price)),
+                                 len(products)),
+            'optimize_portfolio': (lambda: optimize_portfolio(combined_data, models, buying_price), len(models)),
+            'discount_scenarios': (lambda: discount_scenarios(index, models, DISCOUNT_LEVELS, buying_price),
+                                   len(models) * len(DISCOUNT_LEVELS)),
+            'plot_price_quantity': (lambda: plot_price_quantity(largest_data, models[largest]).to_json(),
+                                    len(largest_data)),
+            'plot_discount_impact': (lambda: plot_discount_impact(largest_data, models[largest], buying_price).to_json(),
+                                     len(largest_data)),
+            'plot_elasticity_factors': (lambda: plot_elasticity_factors(index, product=largest).to_json(),
+                                        len(largest_data)),
+        }
+        load_data(directory)  # tạo snapshot trước khi đo bản có cache
+        results = {}
+        for label, (fn, units) in benchmarks.items():
+            results[label] = measure(fn, units, repeat)
+        return {'rows': rows, 'combined_rows': len(combined_data), 'products': len(models),
+                'results': results}
+
+
+def compare(report, baseline, tolerance, slack):
+    # Trả về danh sách (kích thước, hàm, thời gian, mốc) chậm hơn mốc quá ngưỡng cho phép;
+    # slack (giây) bỏ qua dao động của các phép đo rất ngắn
+    regressions = []
+    for size, size_report in report.items():
+        for label, result in size_report['results'].items():
+            reference = baseline.get(size, {}).get(label)
+            if reference and result['seconds'] > reference * tolerance + slack:
+                regressions.append((size, label, result['seconds'], reference))
+    return regressions
+
+
+def print_report(report):
+    for size, size_report in report.items():
+        print(f"\n== {size}: {size_report['rows']} dòng giao dịch, {size_report['combined_rows']} dòng "
+              f"combined_data, {size_report['products']} sản phẩm")
+        print(f"{'Hàm':<26}{'Thời gian (s)':>15}{'Bộ nhớ đỉnh (MB)':>19}{'Thông lượng (/s)':>19}")
+        for label, result in size_report['results'].items():
+            print(f"{label:<26}{result['seconds']:>15.4f}{result['peak_mb']:>19.2f}{result['throughput']:>19.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark pipeline định giá trên dữ liệu giả")
+    parser.add_argument('--sizes', default='small,medium', help=f"Các cỡ dữ liệu: {', '.join(SIZES)}")
+    parser.add_argument('--repeat', type=int, default=3, help="Số lần đo thời gian (lấy nhỏ nhất)")
+    parser.add_argument('--max-products', type=int, default=200,
+                        help="Số sản phẩm tối đa cho các hàm chạy theo từng sản phẩm")
+    parser.add_argument('--output', help="Ghi kết quả đầy đủ ra file JSON")
+    parser.add_argument('--baseline', default=BASELINE_PATH, help="File mốc so sánh")
+    parser.add_argument('--save-baseline', action='store_true', help="Ghi kết quả lần này làm mốc")
+    parser.add_argument('--tolerance', type=float, default=1.5, help="Chậm hơn mốc bao nhiêu lần thì báo")
+    parser.add_argument('--slack', type=float, default=0.01, help="Sai lệch tuyệt đối (giây) được bỏ qua")
+    args = parser.parse_args(argv)
+
+    report = {}
+    for size in args.sizes.split(','):
+        report[size] = run_size(size, SIZES[size], args.repeat, args.max_products)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version, 'machine': platform.machine(), 'report': report}, f, indent=2)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if args.save_baseline:
+        for size, size_report in report.items():
+            baseline[size] = {label: round(result['seconds'], 6)
+                              for label, result in size_report['results'].items()}
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nĐã ghi mốc vào {args.baseline}")
+        return 0
+
+    regressions = compare(report, baseline, args.tolerance, args.slack)
+    for size, label, seconds, reference in regressions:
+        print(f"CHẬM HƠN MỐC: [{size}] {label}: {seconds:.4f}s so với {reference:.4f}s")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
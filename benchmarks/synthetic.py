@@ -0,0 +1,114 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from scripts.CSV import DATE_FORMAT, DATE_INFO_FILE, SALES_FILE, TRANSACTIONS_FILE
+from scripts.products import product_key
+from scripts.registry import LinearModel, save_registry
+
+# Sinh dữ liệu giả cùng lược đồ với 3 file trong data/ và registry mô hình tương ứng.
+# Nhu cầu của mỗi SELL_ID là QUANTITY = a + b * PRICE + nhiễu, nên mô hình ghi ra là mô hình "đúng".
+HOLIDAYS = ['New Year', 'Luner New Year', 'Labor Day', 'Dragon Boat Festivel', 'Mid-Autumn Day']
+COMBO_SHARE = 0.6
+
+
+def _date_strings(dates):
+    return [f"{d.month}/{d.day}/{d.year % 100:02d}" for d in dates]
+
+
+def _transaction_date_strings(dates):
+    # Như file giao dịch thật: ngày 1-12 ghi đủ hai chữ số ("01/05/12"), từ ngày 13 ghi như DateInfo
+    # ("1/13/12"), nên phép gộp theo chuỗi của load_data (typed=False) mất dòng như trên dữ liệu thật
+    return np.where(dates.day <= 12, dates.strftime(DATE_FORMAT), _date_strings(dates))
+
+
+def generate(directory, n_days=365, n_sell_ids=8, rows_per_day=1, n_items=6, seed=0):
+    # Ghi 3 file CSV và registry.npz vào directory; trả về số dòng giao dịch
+    rng = np.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    items = [f"ITEM{i}" for i in range(n_items)]
+
+    # Meta: SELL_ID lẻ (SELL_CATEGORY 0, một sản phẩm) và combo (SELL_CATEGORY 2, 2-3 sản phẩm)
+    sales_rows = []
+    sell_items = {}
+    for sell_id in range(1000, 1000 + n_sell_ids):
+        if rng.random() < COMBO_SHARE and n_items > 1:
+            chosen = rng.choice(n_items, size=min(n_items, int(rng.integers(2, 4))), replace=False)
+            category = 2
+        else:
+            chosen = [int(rng.integers(n_items))]
+            category = 0
+        sell_items[sell_id] = (category, [items[i] for i in chosen])
+        sales_rows += [(sell_id, category, 5000 + int(i), items[i]) for i in chosen]
+    pd.DataFrame(sales_rows, columns=['SELL_ID', 'SELL_CATEGORY', 'ITEM_ID', 'ITEM_NAME']).to_csv(
+        os.path.join(directory, SALES_FILE), index=False)
+
+    # Thông tin ngày
+    dates = pd.date_range('2012-01-01', periods=n_days, freq='D')
+    date_strings = np.array(_date_strings(dates))
+    transaction_date_strings = _transaction_date_strings(dates)
+    holiday = np.where(rng.random(n_days) < 0.05, rng.choice(HOLIDAYS, n_days), None)
+    date_info = pd.DataFrame({
+        'CALENDAR_DATE': date_strings,
+        'YEAR': dates.year,
+        'HOLIDAY': holiday,
+        'IS_WEEKEND': (dates.dayofweek >= 5).astype(int),
+        'IS_SCHOOLBREAK': np.isin(dates.month, [6, 7, 8]).astype(int),
+        'AVERAGE_TEMPERATURE': np.round(rng.normal(25, 5, n_days), 1),
+        'IS_OUTDOOR': (rng.random(n_days) < 0.6).astype(int),
+    })
+    date_info.to_csv(os.path.join(directory, DATE_INFO_FILE), index=False)
+
+    # Giao dịch: mỗi ngày, mỗi SELL_ID có rows_per_day dòng với giá lấy từ vài mức giá cố định
+    sell_ids = np.array(list(sell_items))
+    intercepts = rng.uniform(50, 250, len(sell_ids))
+    base_prices = rng.uniform(10, 16, len(sell_ids))
+    slopes = -intercepts / (base_prices * rng.uniform(2.0, 3.0, len(sell_ids)))
+    noise = rng.uniform(3, 10, len(sell_ids))
+    categories = np.array([sell_items[sell_id][0] for sell_id in sell_ids])
+
+    n_rows = n_days * len(sell_ids) * rows_per_day
+    day = np.repeat(np.arange(n_days), len(sell_ids) * rows_per_day)
+    sell = np.tile(np.repeat(np.arange(len(sell_ids)), rows_per_day), n_days)
+    price = np.round(base_prices[sell] + rng.choice([-1.0, -0.5, 0.0, 0.5, 1.0], n_rows), 2)
+    quantity = intercepts[sell] + slopes[sell] * price + rng.normal(0, 1, n_rows) * noise[sell]
+    quantity = np.maximum(np.round(quantity / rows_per_day), 0).astype(int)
+    pd.DataFrame({
+        'CALENDAR_DATE': transaction_date_strings[day],
+        'PRICE': price,
+        'QUANTITY': quantity,
+        'SELL_ID': sell_ids[sell],
+        'SELL_CATEGORY': categories[sell],
+    }).to_csv(os.path.join(directory, TRANSACTIONS_FILE), index=False)
+
+    # Mô hình: hệ số thật, hiệp phương sai σ²(XᵀX)⁻¹ theo giá đã sinh
+    models = {}
+    for i, sell_id in enumerate(sell_ids):
+        prices = price[sell == i]
+        xtx = np.array([[len(prices), prices.sum()], [prices.sum(), prices @ prices]])
+        scale = noise[i] ** 2
+        for item in sell_items[sell_id][1]:
+            models[product_key(item, sell_id)] = LinearModel(
+                'QUANTITY ~ PRICE', ['Intercept', 'PRICE'], [intercepts[i], slopes[i]],
+                scale * np.linalg.pinv(xtx), nobs=len(prices), scale=scale, df_resid=len(prices) - 2)
+    save_registry(os.path.join(directory, 'registry.npz'), models)
+    return n_rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu giả theo lược đồ data/*.csv")
+    parser.add_argument('directory')
+    parser.add_argument('--days', type=int, default=365)
+    parser.add_argument('--sell-ids', type=int, default=8)
+    parser.add_argument('--rows-per-day', type=int, default=1)
+    parser.add_argument('--items', type=int, default=6)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    rows = generate(args.directory, args.days, args.sell_ids, args.rows_per_day, args.items, args.seed)
+    print(f"Đã sinh {rows} dòng giao dịch vào {args.directory}")
+
+
+if __name__ == '__main__':
+    main()
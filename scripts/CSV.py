@@ -1,26 +1,231 @@
+import glob
+import hashlib
+import json
+import os
+import zipfile
+
+import numpy as np
 import pandas as pd
 
-def load_data():
-    # Tải và xử lý dữ liệu
-    sales = pd.read_csv('data/Cafe - Sell Meta Data.csv')
-    transactions = pd.read_csv('data/Cafe - Transaction - Store.csv')
-    date_info = pd.read_csv('data/DateInfo.csv')
-    
+from .metrics import instrument
+from .products import ProductIndex
+
+DATA_DIR = 'data'
+SALES_FILE = 'Cafe - Sell Meta Data.csv'
+TRANSACTIONS_FILE = 'Cafe - Transaction - Store.csv'
+DATE_INFO_FILE = 'DateInfo.csv'
+# Snapshot nhị phân của combined_data, đặt trong data/.cache và gắn với dấu vân tay file nguồn
+CACHE_DIR = '.cache'
+# Tăng khi đổi cách dựng bảng hoặc định dạng snapshot để snapshot cũ tự bị bỏ
+SNAPSHOT_VERSION = 2
+# Lỗi khi đọc snapshot hỏng (ghi dở, rỗng, không phải file zip): bỏ snapshot và dựng lại
+SNAPSHOT_ERRORS = (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile)
+# Đường nạp có kiểu (typed=True): ngày dạng datetime64, cột chuỗi dạng category, số được thu nhỏ
+CATEGORY_COLUMNS = ['SELL_CATEGORY', 'ITEM_NAME', 'HOLIDAY']
+FLAG_COLUMNS = ['IS_WEEKEND', 'IS_SCHOOLBREAK', 'IS_OUTDOOR']
+DATE_FORMAT = '%m/%d/%y'
+GROUP_COLUMNS = ['SELL_ID', 'SELL_CATEGORY', 'ITEM_NAME', 'CALENDAR_DATE', 'PRICE']
+
+
+def source_paths(data_dir=DATA_DIR):
+    return [os.path.join(data_dir, name) for name in (SALES_FILE, TRANSACTIONS_FILE, DATE_INFO_FILE)]
+
+
+def source_fingerprint(paths):
+    # Dấu vân tay theo tên, kích thước và mtime của các file nguồn (không cần đọc nội dung)
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.basename(path)}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+def _regroup(frames, by):
+    return pd.concat(frames, ignore_index=True).groupby(by, observed=True).QUANTITY.sum().reset_index()
+
+
+def sum_chunks(parts, by):
+    # Cộng dồn QUANTITY theo nhóm qua các phần đã tổng hợp theo từng khối. Các phần chờ được gộp
+    # vào kết quả mỗi khi lớn hơn nó, nên bộ nhớ tỉ lệ với kết quả chứ không với file đầu vào.
+    total, pending, pending_rows = None, [], 0
+    for part in parts:
+        if total is None:
+            total = part
+            continue
+        pending.append(part)
+        pending_rows += len(part)
+        if pending_rows > len(total):
+            total, pending, pending_rows = _regroup([total] + pending, by), [], 0
+    if pending:
+        total = _regroup([total] + pending, by)
+    return total
+
+
+def read_transactions(path, chunksize=None, **kwargs):
+    # Cả file, hoặc một iterator các khối chunksize dòng
+    if chunksize:
+        return pd.read_csv(path, chunksize=chunksize, **kwargs)
+    return [pd.read_csv(path, **kwargs)]
+
+
+@instrument(rows='result')
+def build_combined_data(data_dir=DATA_DIR, chunksize=None):
+    # Tải và xử lý dữ liệu; chunksize: đọc file giao dịch theo khối để giới hạn bộ nhớ
+    sales_path, transactions_path, date_info_path = source_paths(data_dir)
+    sales = pd.read_csv(sales_path)
+    date_info = pd.read_csv(date_info_path)
+
     # Xử lý giá trị thiếu
     date_info['HOLIDAY'] = date_info['HOLIDAY'].fillna("No Holiday")
-    
+
     # Gộp dữ liệu
-    data1 = pd.merge(sales.drop(['ITEM_ID'], axis=1), 
-                    transactions.drop(['SELL_CATEGORY'], axis=1), 
-                    on='SELL_ID')
-    data1columns = data1.groupby(['SELL_ID', 'SELL_CATEGORY', 'ITEM_NAME', 'CALENDAR_DATE', 'PRICE']).QUANTITY.sum()
-    intermediate_data = data1columns.reset_index()
-    combined_data = pd.merge(intermediate_data, date_info, on='CALENDAR_DATE')
-    
+    def group(transactions):
+        data1 = pd.merge(sales.drop(['ITEM_ID'], axis=1),
+                        transactions.drop(['SELL_CATEGORY'], axis=1),
+                        on='SELL_ID')
+        data1columns = data1.groupby(GROUP_COLUMNS).QUANTITY.sum()
+        return data1columns.reset_index()
+
+    parts = (group(transactions) for transactions in read_transactions(transactions_path, chunksize))
+    intermediate_data = sum_chunks(parts, GROUP_COLUMNS)
+    return pd.merge(intermediate_data, date_info, on='CALENDAR_DATE')
+
+
+def day_ordinals(values):
+    # "01/01/12" (file giao dịch) và "1/1/12" (DateInfo) cùng về một số ngày kể từ 1970-01-01;
+    # chỉ phân tích mỗi chuỗi ngày khác nhau một lần
+    codes, uniques = pd.factorize(values)
+    dates = pd.to_datetime(uniques, format=DATE_FORMAT)
+    return dates.to_numpy().astype('datetime64[D]').astype(np.int32)[codes]
+
+
+def day_numbers(dates):
+    # Số ngày kể từ 1970-01-01 cho cột CALENDAR_DATE dạng datetime (bảng có kiểu) hoặc chuỗi
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates.to_numpy().astype('datetime64[D]').astype(np.int64)
+    return day_ordinals(dates).astype(np.int64)
+
+
+@instrument(rows='result')
+def build_typed_data(data_dir=DATA_DIR, chunksize=None):
+    # Cùng các bước như build_combined_data nhưng gộp theo khóa số nguyên (SELL_ID, số ngày),
+    # nên không còn mất dòng do hai file ghi ngày khác định dạng
+    sales_path, transactions_path, date_info_path = source_paths(data_dir)
+    sales = pd.read_csv(sales_path, usecols=['SELL_ID', 'SELL_CATEGORY', 'ITEM_NAME'],
+                        dtype={'SELL_ID': np.int32, 'SELL_CATEGORY': np.int8})
+    date_info = pd.read_csv(date_info_path, dtype={'YEAR': np.int16, 'AVERAGE_TEMPERATURE': np.float32,
+                                                   **{column: np.int8 for column in FLAG_COLUMNS}})
+
+    date_info['DAY'] = day_ordinals(date_info.pop('CALENDAR_DATE'))
+    date_info['HOLIDAY'] = date_info['HOLIDAY'].fillna("No Holiday").astype('category')
+    sales['ITEM_NAME'] = sales['ITEM_NAME'].astype('category')
+    sales['SELL_CATEGORY'] = sales['SELL_CATEGORY'].astype('category')
+
+    by = ['SELL_ID', 'SELL_CATEGORY', 'ITEM_NAME', 'DAY', 'PRICE']
+
+    def group(transactions):
+        transactions['DAY'] = day_ordinals(transactions.pop('CALENDAR_DATE'))
+        data1 = pd.merge(sales, transactions, on='SELL_ID')
+        return data1.groupby(by, observed=True).QUANTITY.sum().reset_index()
+
+    chunks = read_transactions(transactions_path, chunksize, usecols=['CALENDAR_DATE', 'PRICE', 'QUANTITY', 'SELL_ID'],
+                               dtype={'PRICE': np.float32, 'QUANTITY': np.int32, 'SELL_ID': np.int32})
+    intermediate_data = sum_chunks((group(transactions) for transactions in chunks), by)
+    intermediate_data['QUANTITY'] = pd.to_numeric(intermediate_data['QUANTITY'], downcast='integer')
+    combined_data = pd.merge(intermediate_data, date_info, on='DAY')
+    combined_data.insert(3, 'CALENDAR_DATE', combined_data.pop('DAY').to_numpy().astype('datetime64[D]'))
+    return combined_data
+
+
+def filter_bau(combined_data):
     # Lọc dữ liệu BAU (Business As Usual) với IS_OUTDOOR=1
-    bau2_data = combined_data[(combined_data['HOLIDAY'] == 'No Holiday') & 
-                             (combined_data['IS_SCHOOLBREAK'] == 0) & 
-                             (combined_data['IS_WEEKEND'] == 0) & 
-                             (combined_data['IS_OUTDOOR'] == 1)]
-    
+    return combined_data[(combined_data['HOLIDAY'] == 'No Holiday') &
+                         (combined_data['IS_SCHOOLBREAK'] == 0) &
+                         (combined_data['IS_WEEKEND'] == 0) &
+                         (combined_data['IS_OUTDOOR'] == 1)]
+
+
+def _snapshot_array(values):
+    return values.astype(str) if values.dtype == object else values
+
+
+def save_snapshot(path, frame):
+    # Ghi từng cột thành một mảng NumPy; cột chuỗi lưu dạng unicode cố định,
+    # cột category lưu mã (c<i>) và danh sách nhãn (k<i>)
+    columns = {}
+    dtypes = {}
+    for i, (name, series) in enumerate(frame.items()):
+        dtypes[name] = str(series.dtype)
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            columns[f'c{i}'] = series.cat.codes.to_numpy()
+            columns[f'k{i}'] = _snapshot_array(series.cat.categories.to_numpy())
+            continue
+        values = series.to_numpy()
+        columns[f'c{i}'] = values.astype(str) if values.dtype == object or dtypes[name] == 'str' else values
+    meta = json.dumps({'columns': list(frame.columns), 'dtypes': dtypes})
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, __meta__=np.array(meta), **columns)
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path):
+    with np.load(path, allow_pickle=False) as f:
+        meta = json.loads(str(f['__meta__']))
+        data = {}
+        for i, name in enumerate(meta['columns']):
+            values = f[f'c{i}']
+            if meta['dtypes'][name] == 'category':
+                categories = f[f'k{i}']
+                if categories.dtype.kind == 'U':
+                    categories = categories.astype(object)
+                data[name] = pd.Categorical.from_codes(values, categories=pd.Index(categories))
+                continue
+            if values.dtype.kind == 'U':
+                values = values.astype(object)
+            data[name] = pd.Series(values).astype(meta['dtypes'][name])
+    return pd.DataFrame(data)
+
+
+@instrument(rows='result')
+def load_combined_data(data_dir=DATA_DIR, use_cache=True, typed=False, chunksize=None):
+    # Dùng lại snapshot nếu file nguồn không đổi, ngược lại dựng lại và ghi snapshot mới.
+    # chunksize không đổi kết quả nên dùng chung snapshot với cách đọc cả file.
+    build = build_typed_data if typed else build_combined_data
+    if not use_cache:
+        return build(data_dir, chunksize)
+    prefix = 'typed' if typed else 'combined'
+    cache_dir = os.path.join(data_dir, CACHE_DIR)
+    snapshot = os.path.join(cache_dir,
+                            f"{prefix}-v{SNAPSHOT_VERSION}-{source_fingerprint(source_paths(data_dir))}.npz")
+    if os.path.exists(snapshot):
+        try:
+            return load_snapshot(snapshot)
+        except SNAPSHOT_ERRORS:
+            pass
+    combined_data = build(data_dir, chunksize)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        for stale in glob.glob(os.path.join(cache_dir, f'{prefix}-*.npz')):
+            if stale != snapshot:
+                os.remove(stale)
+        save_snapshot(snapshot, combined_data)
+    except OSError:
+        # Thư mục chỉ đọc: vẫn trả dữ liệu, chỉ bỏ qua việc ghi snapshot
+        pass
+    return combined_data
+
+
+@instrument(rows='result')
+def load_data(data_dir=DATA_DIR, use_cache=True, typed=False, chunksize=None):
+    # typed=True: bảng gọn hơn nhiều lần và giữ mọi dòng giao dịch (xem build_typed_data);
+    # chunksize: đọc file giao dịch theo khối, bộ nhớ đỉnh tỉ lệ với bảng đã tổng hợp
+    combined_data = load_combined_data(data_dir, use_cache, typed, chunksize)
+    bau2_data = filter_bau(combined_data)
     return combined_data, bau2_data
+
+
+def load_indexed_data(data_dir=DATA_DIR, use_cache=True, typed=False, chunksize=None):
+    # Dựng chỉ mục sản phẩm/phân khúc một lần cho cả hai bảng
+    combined_data, bau2_data = load_data(data_dir, use_cache, typed, chunksize)
+    return ProductIndex(combined_data), ProductIndex(bau2_data)
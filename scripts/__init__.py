@@ -3,32 +3,31 @@ import numpy as np
 import pickle
 import plotly.express as px
 import plotly.graph_objects as go
-from statsmodels.formula.api import ols
+from .optimizer import find_optimal_price, optimize_portfolio, optimize_combo, adjustment_records
+from .products import ProductIndex, split_product_key
+from .regression import ols_from_sums
+from .cube import SegmentCube
+from .scenarios import discount_scenarios, evaluate_schedule, price_schedule_scenarios
+from .metrics import instrument
+from .risk import find_risk_adjusted_price, risk_portfolio, risk_profile, quantile_column
+from .rolling import rolling_elasticity
 
 def load_model(file_path):
     with open(file_path, 'rb') as f:
         return pickle.load(f)
 
-def find_optimal_price(data, model, buying_price):
-    start_price = data.PRICE.min() - 1
-    end_price = data.PRICE.min() + 10
-    test = pd.DataFrame(columns=["PRICE", "QUANTITY"])
-    test['PRICE'] = np.arange(start_price, end_price, 0.01)
-    test['QUANTITY'] = model.predict(test['PRICE'])
-    test['PROFIT'] = (test["PRICE"] - buying_price) * test["QUANTITY"]
-    ind = np.where(test['PROFIT'] == test['PROFIT'].max())[0][0]
-    return test.iloc[[ind]]
-
+@instrument()
 def predict_revenue(data, model, test_price):
     quantity = model.predict(pd.DataFrame({'PRICE': [test_price]}))[0]
     revenue = test_price * quantity
     return revenue, quantity
 
+@instrument()
 def analyze_discount(data, model, discount_percent, buying_price):
     current_price = data.PRICE.mean()
     discounted_price = current_price * (1 - discount_percent / 100)
-    quantity = model.predict(pd.DataFrame({'PRICE': [discounted_price]}))[0]
-    profit = (discounted_price - buying_price) * quantity
+    quantities, _, profits = evaluate_schedule(model, [discounted_price], buying_price)
+    quantity, profit = quantities[0], profits[0]
     return {
         'discounted_price': discounted_price,
         'quantity': quantity,
@@ -69,17 +68,17 @@ def analyze_discount(data, model, discount_percent, buying_price):
 #         })
 #     return pd.DataFrame(recommendations)
 
+@instrument()
 def calculate_adjustment(product_data, model, buying_price, product_key):
     current_price = product_data['PRICE'].mean()
     optimal_result = find_optimal_price(product_data, model, buying_price)
     optimal_price = optimal_result['PRICE'].iloc[0]
 
-    # Tính độ co giãn giá
-    try:
-        model_fit = ols("QUANTITY ~ PRICE", data=product_data).fit()
-        elasticity = model_fit.params['PRICE']
-    except:
-        elasticity = float('nan')
+    # Tính độ co giãn giá từ các tổng của hồi quy QUANTITY ~ PRICE (không qua API công thức)
+    price = product_data['PRICE'].to_numpy(dtype=float)
+    quantity = product_data['QUANTITY'].to_numpy(dtype=float)
+    _, slope = ols_from_sums(len(price), price.sum(), quantity.sum(), price @ price, price @ quantity)
+    elasticity = float(slope)
     
     adjustment = optimal_price - current_price
     return {
@@ -91,31 +90,54 @@ def calculate_adjustment(product_data, model, buying_price, product_key):
         'Thay đổi': round(abs(adjustment), 2)
     }
 
-def plot_price_quantity(data, model):
+# Ngưỡng số điểm khi vẽ: trên SCATTERGL_THRESHOLD dùng WebGL, trên DENSITY_THRESHOLD gom thành
+# lưới mật độ ở server; boxplot trên BOXPOINTS_THRESHOLD điểm chỉ gửi tứ phân vị đã tính sẵn
+SCATTERGL_THRESHOLD = 5000
+DENSITY_THRESHOLD = 50000
+BOXPOINTS_THRESHOLD = 2000
+DENSITY_BINS = 80
+
+def _plot_mode(n_points, mode):
+    if mode != 'auto':
+        return mode
+    if n_points > DENSITY_THRESHOLD:
+        return 'density'
+    return 'webgl' if n_points > SCATTERGL_THRESHOLD else 'raw'
+
+def _density_trace(x, y, bins=DENSITY_BINS):
+    # Histogram 2D tính sẵn; ô trống để None cho nền trong suốt
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins)
+    counts = np.where(counts > 0, counts, np.nan).T
+    return go.Heatmap(x=(x_edges[:-1] + x_edges[1:]) / 2, y=(y_edges[:-1] + y_edges[1:]) / 2,
+                      z=counts, colorscale='Blues', name='Dữ liệu thực tế (mật độ)',
+                      colorbar=dict(title='Số ngày'), hoverongaps=False)
+
+@instrument()
+def plot_price_quantity(data, model, mode='auto'):
+    # mode: 'raw' (SVG, mọi điểm), 'webgl' (Scattergl), 'density' (lưới mật độ), 'auto' theo số điểm
     prices = np.arange(data.PRICE.min() - 1, data.PRICE.min() + 10, 0.01)
     quantities = model.predict(pd.DataFrame({'PRICE': prices}))
     
     fig = go.Figure()
-    fig.add_trace(go.Scatter(x=data.PRICE, y=data.QUANTITY, mode='markers', 
-                            name='Dữ liệu thực tế', opacity=0.3))
+    mode = _plot_mode(len(data), mode)
+    if mode == 'density':
+        fig.add_trace(_density_trace(data.PRICE.to_numpy(dtype=float), data.QUANTITY.to_numpy(dtype=float)))
+    else:
+        scatter = go.Scattergl if mode == 'webgl' else go.Scatter
+        fig.add_trace(scatter(x=data.PRICE, y=data.QUANTITY, mode='markers', 
+                              name='Dữ liệu thực tế', opacity=0.3))
     fig.add_trace(go.Scatter(x=prices, y=quantities, mode='lines', 
                             name='Dự đoán hồi quy'))
     fig.update_layout(title='Mối quan hệ Giá - Số lượng',
                      xaxis_title='Giá', yaxis_title='Số lượng')
     return fig
 
+@instrument()
 def plot_discount_impact(data, model, buying_price):
     discounts = np.arange(0, 51, 5)
     current_price = data.PRICE.mean()
-    quantities = []
-    profits = []
-    
-    for discount in discounts:
-        price = current_price * (1 - discount / 100)
-        quantity = model.predict(pd.DataFrame({'PRICE': [price]}))[0]
-        profit = (price - buying_price) * quantity
-        quantities.append(quantity)
-        profits.append(profit)
+    # Đánh giá mọi mức giảm giá trong một lần predict
+    quantities, _, profits = evaluate_schedule(model, current_price * (1 - discounts / 100), buying_price)
     
     fig = go.Figure()
     fig.add_trace(go.Bar(x=discounts, y=quantities, name='Số lượng'))
@@ -129,14 +151,34 @@ def plot_discount_impact(data, model, buying_price):
     )
     return fig
 
-def plot_elasticity_factors(data, product=None):
-    # Nếu có sản phẩm cụ thể, lọc dữ liệu theo sản phẩm
-    if product:
-        product_name = product.split('_')[0].upper()
-        sell_id = int(product.split('_')[1])
+def _box_trace(values, name, aggregate):
+    if not aggregate:
+        return go.Box(y=values, name=name, boxpoints='all', jitter=0.3, pointpos=-1.8)
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return go.Box(name=name)
+    # Tứ phân vị tính sẵn (cùng cách nội suy tuyến tính của plotly), râu tới điểm xa nhất trong 1.5 IQR
+    q1, median, q3 = np.percentile(values, [25, 50, 75])
+    iqr = q3 - q1
+    lowerfence = values[values >= q1 - 1.5 * iqr].min()
+    upperfence = values[values <= q3 + 1.5 * iqr].max()
+    return go.Box(x=[name], q1=[q1], median=[median], q3=[q3], lowerfence=[lowerfence],
+                  upperfence=[upperfence], mean=[values.mean()], name=name, boxpoints=False)
+
+@instrument()
+def plot_elasticity_factors(data, product=None, mode='auto'):
+    # mode: 'raw' gửi mọi điểm (boxpoints='all'), 'aggregate' chỉ gửi tứ phân vị, 'auto' theo số điểm
+    # Nếu có sản phẩm cụ thể, lọc dữ liệu theo sản phẩm (tra chỉ mục nếu được truyền ProductIndex)
+    if isinstance(data, ProductIndex):
+        filtered_data = data.product(product) if product else data.data
+    elif product:
+        product_name, sell_id = split_product_key(product)
         filtered_data = data[(data['ITEM_NAME'] == product_name) & (data['SELL_ID'] == sell_id)]
     else:
         filtered_data = data
+    if mode == 'auto':
+        mode = 'aggregate' if len(filtered_data) > BOXPOINTS_THRESHOLD else 'raw'
+    aggregate = mode == 'aggregate'
     
     # Tạo boxplot so sánh QUANTITY theo HOLIDAY, IS_WEEKEND, IS_SCHOOLBREAK
     fig = go.Figure()
@@ -144,20 +186,17 @@ def plot_elasticity_factors(data, product=None):
     # Boxplot theo HOLIDAY
     for holiday in filtered_data['HOLIDAY'].unique():
         subset = filtered_data[filtered_data['HOLIDAY'] == holiday]
-        fig.add_trace(go.Box(y=subset['QUANTITY'], name=f'Ngày lễ: {holiday}',
-                             boxpoints='all', jitter=0.3, pointpos=-1.8))
+        fig.add_trace(_box_trace(subset['QUANTITY'], f'Ngày lễ: {holiday}', aggregate))
     
     # Boxplot theo IS_WEEKEND
     for weekend in [0, 1]:
         subset = filtered_data[filtered_data['IS_WEEKEND'] == weekend]
-        fig.add_trace(go.Box(y=subset['QUANTITY'], name=f'Cuối tuần: {"Có" if weekend else "Không"}',
-                             boxpoints='all', jitter=0.3, pointpos=-1.8))
+        fig.add_trace(_box_trace(subset['QUANTITY'], f'Cuối tuần: {"Có" if weekend else "Không"}', aggregate))
     
     # Boxplot theo IS_SCHOOLBREAK
     for schoolbreak in [0, 1]:
         subset = filtered_data[filtered_data['IS_SCHOOLBREAK'] == schoolbreak]
-        fig.add_trace(go.Box(y=subset['QUANTITY'], name=f'Kỳ nghỉ học: {"Có" if schoolbreak else "Không"}',
-                             boxpoints='all', jitter=0.3, pointpos=-1.8))
+        fig.add_trace(_box_trace(subset['QUANTITY'], f'Kỳ nghỉ học: {"Có" if schoolbreak else "Không"}', aggregate))
     
     fig.update_layout(
         title='Ảnh hưởng của Ngày lễ, Cuối tuần, Kỳ nghỉ học đến Số lượng bán',
@@ -165,4 +204,45 @@ def plot_elasticity_factors(data, product=None):
         xaxis_title='Yếu tố',
         boxmode='group'
     )
-    return fig
\ No newline at end of file
+    return fig
+
+@instrument(rows=None)
+def plot_profit_risk(profile, low_quantile=0.05, high_quantile=0.95):
+    # profile: kết quả risk_profile; dải lợi nhuận giữa hai phân vị và đường lợi nhuận kỳ vọng
+    low, high = quantile_column(low_quantile), quantile_column(high_quantile)
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=profile.PRICE, y=profile[high], mode='lines', line=dict(width=0),
+                             showlegend=False, hoverinfo='skip'))
+    fig.add_trace(go.Scatter(x=profile.PRICE, y=profile[low], mode='lines', line=dict(width=0),
+                             fill='tonexty', name=f'Lợi nhuận {low_quantile:.0%} - {high_quantile:.0%}'))
+    fig.add_trace(go.Scatter(x=profile.PRICE, y=profile.EXPECTED_PROFIT, mode='lines', name='Lợi nhuận kỳ vọng'))
+    fig.add_trace(go.Scatter(x=profile.PRICE, y=profile.PROB_LOSS, mode='lines', name='Xác suất lỗ',
+                             yaxis='y2', line=dict(dash='dot')))
+    fig.update_layout(
+        title='Rủi ro Lợi nhuận theo Giá (Monte Carlo)',
+        xaxis_title='Giá',
+        yaxis_title='Lợi nhuận',
+        yaxis2=dict(title='Xác suất lỗ', overlaying='y', side='right', range=[0, 1])
+    )
+    return fig
+
+@instrument(rows=None)
+def plot_rolling_elasticity(series, product=None):
+    # series: kết quả rolling_elasticity; hệ số giá và độ co giãn theo thời gian của một sản phẩm
+    if product is not None:
+        series = series[series['PRODUCT'] == product]
+    hover = [f"{start:%d/%m/%Y} - {end:%d/%m/%Y}<br>{n} ngày dữ liệu"
+             for start, end, n in zip(series.WINDOW_START, series.WINDOW_END, series.N)]
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=series.WINDOW_END, y=series.SLOPE, mode='lines+markers', name='Hệ số giá',
+                             text=hover, hovertemplate='%{text}<br>Hệ số giá: %{y:.3f}<extra></extra>'))
+    fig.add_trace(go.Scatter(x=series.WINDOW_END, y=series.ELASTICITY, mode='lines+markers', name='Độ co giãn',
+                             yaxis='y2', line=dict(dash='dot'), text=hover,
+                             hovertemplate='%{text}<br>Độ co giãn: %{y:.3f}<extra></extra>'))
+    fig.update_layout(
+        title='Độ co giãn Giá theo Cửa sổ Thời gian',
+        xaxis_title='Ngày cuối cửa sổ',
+        yaxis_title='Hệ số giá (QUANTITY ~ PRICE)',
+        yaxis2=dict(title='Độ co giãn tại điểm trung bình', overlaying='y', side='right')
+    )
+    return fig
@@ -0,0 +1,129 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .CSV import DATA_DIR, filter_bau, load_data
+from .optimizer import optimize_portfolio
+from .risk import risk_portfolio
+from .registry import current_registry_path, load_registry
+from .service import SHARED_META, attach_frame, export_frame, prune_shared, shared_directory
+
+# Chạy đề xuất điều chỉnh giá hàng loạt không qua Streamlit:
+#   python -m scripts.batch --buying-prices gia_mua.csv --output de_xuat.csv --workers 8
+# File giá mua có cột PRODUCT, BUYING_PRICE và (tùy chọn) SCENARIO để chạy nhiều kịch bản một lần.
+SEGMENTS = ('combined', 'bau2')
+DEFAULT_SCENARIO = 'default'
+
+# Dữ liệu và mô hình của từng tiến trình con, nạp một lần trong initializer
+_worker_state = {}
+
+
+def _init_worker(data_dir, registry_path, typed=False, shared_dir=None):
+    # shared_dir: combined_data đã được tiến trình cha xuất ra, gắn vào bằng mmap thay vì nạp lại
+    if shared_dir:
+        combined_data = attach_frame(shared_dir)
+        bau2_data = filter_bau(combined_data)
+    else:
+        combined_data, bau2_data = load_data(data_dir, typed=typed)
+    _worker_state['data'] = {'combined': combined_data, 'bau2': bau2_data}
+    _worker_state['models'] = load_registry(registry_path)
+
+
+def _run_task(task):
+    scenario, segment, products, buying_prices, default_buying_price, risk_samples = task
+    models = {key: _worker_state['models'][key] for key in products}
+    data = _worker_state['data'][segment]
+    result = optimize_portfolio(data, models, buying_prices, default_buying_price)
+    if risk_samples:
+        # Giá điều chỉnh theo rủi ro (Monte Carlo) đặt cạnh giá tối ưu theo dự đoán điểm
+        risk = risk_portfolio(data, models, buying_prices, default_buying_price, samples=risk_samples)
+        risk = risk.drop(columns=['PRODUCT', 'BUYING_PRICE']).add_prefix('RISK_')
+        result = pd.concat([result, risk], axis=1)
+    result.insert(0, 'SEGMENT', segment)
+    result.insert(0, 'SCENARIO', scenario)
+    return result
+
+
+def read_buying_prices(path):
+    # Trả về {kịch bản: {khóa sản phẩm: giá mua}}
+    prices = pd.read_parquet(path) if path.endswith('.parquet') else pd.read_csv(path)
+    missing = {'PRODUCT', 'BUYING_PRICE'} - set(prices.columns)
+    if missing:
+        raise ValueError(f"File giá mua thiếu cột: {', '.join(sorted(missing))}")
+    if 'SCENARIO' not in prices.columns:
+        prices['SCENARIO'] = DEFAULT_SCENARIO
+    return {str(scenario): dict(zip(group['PRODUCT'], group['BUYING_PRICE'].astype(float)))
+            for scenario, group in prices.groupby('SCENARIO', sort=False)}
+
+
+def build_tasks(products, scenarios, segments, chunks, default_buying_price, risk_samples=0):
+    tasks = []
+    for scenario, buying_prices in scenarios.items():
+        for segment in segments:
+            for chunk in np.array_split(np.array(products, dtype=object), chunks):
+                if len(chunk):
+                    tasks.append((scenario, segment, list(chunk), buying_prices, default_buying_price,
+                                  risk_samples))
+    return tasks
+
+
+def run_batch(buying_prices_path, data_dir=DATA_DIR, registry_path=None, segments=SEGMENTS,
+              workers=None, default_buying_price=9.0, typed=False, risk_samples=0):
+    registry_path = registry_path or current_registry_path()
+    workers = workers or os.cpu_count() or 1
+    scenarios = read_buying_prices(buying_prices_path) if buying_prices_path else {DEFAULT_SCENARIO: {}}
+    products = list(load_registry(registry_path))
+    # Chia mỗi kịch bản thành vài phần cho mỗi tiến trình để cân bằng tải
+    tasks = build_tasks(products, scenarios, segments, max(1, workers * 4 // max(1, len(scenarios))),
+                        default_buying_price, risk_samples)
+    if workers == 1:
+        _init_worker(data_dir, registry_path, typed)
+        results = [_run_task(task) for task in tasks]
+    else:
+        shared_dir = shared_directory(data_dir, typed)
+        if not os.path.exists(os.path.join(shared_dir, SHARED_META)):
+            export_frame(load_data(data_dir, typed=typed)[0], shared_dir)
+            prune_shared(data_dir, typed)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(data_dir, registry_path, typed, shared_dir)) as pool:
+            results = list(pool.map(_run_task, tasks))
+    result = pd.concat(results, ignore_index=True)
+    result['RECOMMENDATION'] = np.where(result['ADJUSTMENT'] > 0, 'Tăng', 'Giảm')
+    # Sản phẩm không có dữ liệu trong phân khúc thì không có giá hiện tại để so sánh
+    return result[result['N'] > 0].reset_index(drop=True)
+
+
+def write_result(result, path):
+    if path.endswith('.parquet'):
+        result.to_parquet(path, index=False)
+    else:
+        result.to_csv(path, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đề xuất điều chỉnh giá hàng loạt cho mọi sản phẩm")
+    parser.add_argument('--buying-prices', help="CSV/Parquet với cột PRODUCT, BUYING_PRICE[, SCENARIO]")
+    parser.add_argument('--output', required=True, help="File kết quả (.csv hoặc .parquet)")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="Thư mục chứa 3 file CSV nguồn")
+    parser.add_argument('--models', help="Registry mô hình (.npz); mặc định theo models/manifest.json")
+    parser.add_argument('--segment', choices=SEGMENTS + ('both',), default='both',
+                        help="Dữ liệu dùng tính giá hiện tại và độ co giãn")
+    parser.add_argument('--workers', type=int, default=None, help="Số tiến trình (mặc định: số nhân CPU)")
+    parser.add_argument('--default-buying-price', type=float, default=9.0,
+                        help="Giá mua cho sản phẩm không có trong file")
+    parser.add_argument('--typed', action='store_true', help="Dùng bảng có kiểu (giữ mọi dòng giao dịch)")
+    parser.add_argument('--risk', type=int, default=0, metavar='SAMPLES',
+                        help="Thêm cột RISK_* từ mô phỏng Monte Carlo với số mẫu này (0 = tắt)")
+    args = parser.parse_args(argv)
+    segments = SEGMENTS if args.segment == 'both' else (args.segment,)
+    result = run_batch(args.buying_prices, args.data_dir, args.models, segments, args.workers,
+                       args.default_buying_price, args.typed, args.risk)
+    write_result(result, args.output)
+    print(f"Đã ghi {len(result)} đề xuất vào {args.output}")
+
+
+if __name__ == '__main__':
+    main()
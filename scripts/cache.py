@@ -0,0 +1,113 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+from .optimizer import _buying_price_vector, optimize_combo, optimize_portfolio
+
+# Bộ nhớ đệm kết quả tính toán dùng chung giữa các phiên Streamlit. Khóa gồm sản phẩm, dấu vân
+# tay của phân khúc dữ liệu (kèm phiên bản mô hình), giá mua, bộ lọc, mức giảm giá..., nên mỗi
+# lần rerun chỉ tính lại phần có đầu vào thay đổi.
+DEFAULT_MAXSIZE = 4096
+# Biểu đồ Plotly lớn hơn nhiều so với một dòng kết quả nên dùng bộ đệm riêng, nhỏ hơn
+FIGURE_MAXSIZE = 128
+_MISSING = object()
+
+
+def data_fingerprint(frame, *extra):
+    # Băm nội dung bảng (một lần khi nạp dữ liệu) cùng các giá trị phụ như đường dẫn registry
+    digest = hashlib.sha1(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    for value in extra:
+        digest.update(str(value).encode())
+    return digest.hexdigest()[:16]
+
+
+class LRUCache:
+    # Từ điển giới hạn kích thước, loại bỏ mục ít được dùng gần đây nhất; an toàn đa luồng
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._items.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute, *args, **kwargs):
+        # Hai phiên cùng trượt một khóa có thể cùng tính; kết quả như nhau nên không khóa lúc tính
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute(*args, **kwargs)
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'size': len(self._items), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'hit_rate': self.hits / total if total else 0.0}
+
+
+def cached_portfolio(cache, fingerprint, data, models, buying_prices, default_buying_price=9.0):
+    # Như optimize_portfolio nhưng mỗi dòng được đệm theo (sản phẩm, dữ liệu, giá mua);
+    # các sản phẩm chưa có trong bộ đệm được tối ưu chung trong một lần gọi
+    keys = list(models)
+    costs = _buying_price_vector(keys, buying_prices, default_buying_price)
+    cache_keys = [('portfolio', key, fingerprint, float(cost)) for key, cost in zip(keys, costs)]
+    rows = [cache.get(cache_key) for cache_key in cache_keys]
+    missing = [i for i, row in enumerate(rows) if row is None]
+    if missing:
+        computed = optimize_portfolio(data, {keys[i]: models[keys[i]] for i in missing}, costs[missing])
+        for position, i in enumerate(missing):
+            rows[i] = computed.iloc[[position]]
+            cache.put(cache_keys[i], rows[i])
+    if not rows:
+        return optimize_portfolio(data, {}, costs)
+    return pd.concat(rows, ignore_index=True)
+
+
+def cached_combo(cache, fingerprint, models, buying_prices, max_total=None, data=None, default_buying_price=9.0):
+    # optimize_combo đệm theo (sản phẩm trong combo, dữ liệu, giá mua từng sản phẩm, giới hạn tổng giá).
+    # Lỗi ràng buộc không khả thi cũng được đệm để không phải tìm lại.
+    keys = tuple(models)
+    costs = tuple(float(cost) for cost in _buying_price_vector(keys, buying_prices, default_buying_price))
+    cache_key = ('combo', keys, fingerprint, costs, max_total)
+
+    def compute():
+        try:
+            return optimize_combo(models, dict(zip(keys, costs)), max_total=max_total, data=data)
+        except ValueError as error:
+            return error
+
+    result = cache.get_or_compute(cache_key, compute)
+    if isinstance(result, ValueError):
+        raise ValueError(str(result))
+    return result.copy()
@@ -0,0 +1,60 @@
+import numpy as np
+
+from .metrics import instrument
+from .products import product_key
+from .regression import PRODUCT_COLUMNS, SUM_COLUMNS, ols_from_sums, sufficient_stats
+
+CUBE_COLUMNS = ['HOLIDAY', 'IS_WEEKEND', 'IS_SCHOOLBREAK', 'IS_OUTDOOR']
+
+
+class SegmentCube:
+    # Khối thống kê đủ của QUANTITY ~ PRICE cho từng ô (sản phẩm, HOLIDAY, IS_WEEKEND,
+    # IS_SCHOOLBREAK, IS_OUTDOOR). Một tổ hợp bộ lọc bất kỳ chỉ cần cộng các ô của sản phẩm,
+    # không gọi API công thức và không sao chép dữ liệu.
+
+    @instrument()
+    def __init__(self, data):
+        stats = sufficient_stats(data, by=PRODUCT_COLUMNS + CUBE_COLUMNS).reset_index()
+        self._cells = {}
+        for (item, sell_id), cells in stats.groupby(PRODUCT_COLUMNS, observed=True, sort=False):
+            self._cells[product_key(item, sell_id)] = (
+                {column: cells[column].to_numpy() for column in CUBE_COLUMNS},
+                cells[SUM_COLUMNS].to_numpy(dtype=float),
+                cells['MIN_P'].to_numpy(dtype=float),
+                cells['MAX_P'].to_numpy(dtype=float),
+            )
+
+    def __contains__(self, key):
+        return key in self._cells
+
+    def keys(self):
+        return list(self._cells)
+
+    @instrument(rows=None)
+    def query(self, key, holiday=None, weekend=None, schoolbreak=None, outdoor=None):
+        # Hồi quy trên tập ô khớp bộ lọc (None = tất cả); n = 0 khi không có dữ liệu
+        labels, sums, lowest, highest = self._cells[key]
+        mask = np.ones(len(sums), dtype=bool)
+        for column, value in zip(CUBE_COLUMNS, (holiday, weekend, schoolbreak, outdoor)):
+            if value is not None:
+                mask &= labels[column] == value
+        n, sum_p, sum_q, sum_pp, sum_pq, _ = sums[mask].sum(axis=0)
+        intercept, slope = ols_from_sums(n, sum_p, sum_q, sum_pp, sum_pq)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_price, mean_quantity = sum_p / n, sum_q / n
+            elasticity = slope * mean_price / mean_quantity
+        return {
+            'n': int(n),
+            'intercept': float(intercept),
+            'slope': float(slope),
+            'elasticity': float(elasticity),
+            'mean_price': float(mean_price),
+            'mean_quantity': float(mean_quantity),
+            'min_price': float(lowest[mask].min()) if mask.any() else np.nan,
+            'max_price': float(highest[mask].max()) if mask.any() else np.nan,
+        }
+
+    def curve(self, key, prices, **filters):
+        # Đường hồi quy theo bộ lọc tại các mức giá cho trước
+        fit = self.query(key, **filters)
+        return fit['intercept'] + fit['slope'] * np.asarray(prices, dtype=float)
@@ -0,0 +1,251 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from .CSV import (DATA_DIR, DATE_INFO_FILE, SALES_FILE, TRANSACTIONS_FILE, day_numbers, filter_bau, load_data,
+                  source_fingerprint, source_paths)
+from .products import product_key
+from .registry import MANIFEST_PATH, LinearModel, new_version, publish_version, read_manifest, save_registry
+from .regression import ols_from_sums
+
+# Nạp thêm một file giao dịch và công bố mô hình cập nhật thành phiên bản mới trong manifest:
+#   python -m scripts.ingest giao-dich-moi.csv --segment both
+# Các dòng được nối vào file giao dịch nguồn nên DataService của app nạp lại cả dữ liệu lẫn mô hình.
+# Khóa nội bộ dùng số ngày (DAY) thay cho chuỗi ngày: file giao dịch ghi "01/01/12", DateInfo ghi
+# "1/1/12", bảng có kiểu dùng datetime64 -- cả ba về cùng một số
+KEY_COLUMNS = ['SELL_ID', 'SELL_CATEGORY', 'ITEM_NAME', 'DAY', 'PRICE']
+# Vị trí trong vector thống kê đủ: n, ΣP, ΣQ, ΣP², ΣPQ, ΣQ²
+N, SUM_P, SUM_Q, SUM_PP, SUM_PQ, SUM_QQ = range(6)
+# Phân khúc của registry (như scripts.train) -> phân khúc của IncrementalStore
+STORE_SEGMENTS = {'combined': 'all', 'bau2': 'bau'}
+# Như scripts.train: sản phẩm có ít ngày dữ liệu hơn thì không đưa vào registry
+MIN_OBSERVATIONS = 3
+
+
+def _is_bau(date_row):
+    holiday, is_weekend, is_schoolbreak, is_outdoor = date_row
+    return holiday == 'No Holiday' and is_schoolbreak == 0 and is_weekend == 0 and is_outdoor == 1
+
+
+class IncrementalStore:
+    # Nạp thêm giao dịch theo lô (định dạng "Cafe - Transaction - Store.csv") mà không dựng lại
+    # toàn bộ combined_data. Số lượng tổng hợp theo ngày giữ trong dict, hồi quy QUANTITY ~ PRICE
+    # của từng sản phẩm cập nhật qua thống kê đủ, nên chi phí mỗi lô tỉ lệ với kích thước lô.
+    # segment='bau' khớp với dữ liệu đã train các mô hình trong models/ (bau2_data), 'all' dùng toàn bộ.
+    # Chỉ nhận bảng có kiểu (load_data(typed=True)): bảng chuỗi gộp ngày theo chuỗi nên lệch với khóa
+    # theo số ngày của các lô mới. combined_data() trả về cùng cột và kiểu với bảng đầu vào.
+
+    def __init__(self, combined_data, data_dir=DATA_DIR, segment='bau'):
+        if segment not in ('bau', 'all'):
+            raise ValueError("segment phải là 'bau' hoặc 'all'")
+        if not pd.api.types.is_datetime64_any_dtype(combined_data['CALENDAR_DATE']):
+            raise ValueError("IncrementalStore cần bảng có kiểu (load_data(typed=True))")
+        self.segment = segment
+        sales = pd.read_csv(os.path.join(data_dir, SALES_FILE))
+        self.date_info = pd.read_csv(os.path.join(data_dir, DATE_INFO_FILE))
+        self.date_info['HOLIDAY'] = self.date_info['HOLIDAY'].fillna("No Holiday")
+
+        self._items = {}
+        for sell_id, category, item in zip(sales['SELL_ID'], sales['SELL_CATEGORY'], sales['ITEM_NAME']):
+            self._items.setdefault(sell_id, []).append((category, item))
+        self.date_info['DAY'] = day_numbers(self.date_info['CALENDAR_DATE'])
+        # Trọng số của mỗi ngày là số dòng DateInfo của ngày đó thuộc phân khúc: phép merge của load_data
+        # lặp lại giao dịch theo từng dòng (DateInfo ghi 3/1/13 hai lần), nên thống kê đủ cũng đếm như vậy
+        self._weights = {}
+        for day, *row in zip(self.date_info['DAY'].tolist(), self.date_info['HOLIDAY'],
+                             self.date_info['IS_WEEKEND'], self.date_info['IS_SCHOOLBREAK'],
+                             self.date_info['IS_OUTDOOR']):
+            self._weights[day] = self._weights.get(day, 0) + (segment == 'all' or _is_bau(row))
+
+        # Giá trong khóa theo kiểu của bảng đầu vào (float32 ở bảng có kiểu) để lô mới khớp đúng khóa cũ
+        self._dtypes = combined_data.dtypes
+        self._price_dtype = combined_data['PRICE'].dtype
+        keys = zip(combined_data['SELL_ID'].tolist(), combined_data['SELL_CATEGORY'].tolist(),
+                   combined_data['ITEM_NAME'].tolist(), day_numbers(combined_data['CALENDAR_DATE']).tolist(),
+                   combined_data['PRICE'].tolist())
+        self._quantities = dict(zip(keys, combined_data['QUANTITY'].tolist()))
+        self.stats = {}
+        for key, quantity in self._quantities.items():
+            self._update_stats(key, None, quantity)
+        self._frame = None
+
+    @classmethod
+    def from_data_dir(cls, data_dir=DATA_DIR, segment='bau'):
+        combined_data, _ = load_data(data_dir, typed=True)
+        return cls(combined_data, data_dir, segment)
+
+    def _in_segment(self, day):
+        return self._weights.get(day, 0) > 0
+
+    def _update_stats(self, key, old, new):
+        # Thay quan sát (giá, số lượng cũ) bằng (giá, số lượng mới); old=None nghĩa là quan sát mới
+        sell_id, _, item, day, price = key
+        weight = self._weights.get(day, 0)
+        if not weight:
+            return
+        stats = self.stats.get(product_key(item, sell_id))
+        if stats is None:
+            stats = self.stats[product_key(item, sell_id)] = np.zeros(6)
+        if old is None:
+            old = 0
+            stats[N] += weight
+            stats[SUM_P] += weight * price
+            stats[SUM_PP] += weight * price * price
+        stats[SUM_Q] += weight * (new - old)
+        stats[SUM_PQ] += weight * price * (new - old)
+        stats[SUM_QQ] += weight * (new * new - old * old)
+
+    def append(self, transactions):
+        # Gộp lô mới vào số lượng theo ngày; trả về tập khóa sản phẩm có hồi quy thay đổi
+        batch = pd.DataFrame({'SELL_ID': transactions['SELL_ID'].to_numpy(),
+                              'DAY': day_numbers(transactions['CALENDAR_DATE']),
+                              'PRICE': transactions['PRICE'].to_numpy().astype(self._price_dtype),
+                              'QUANTITY': transactions['QUANTITY'].to_numpy()})
+        batch = batch.groupby(['SELL_ID', 'DAY', 'PRICE']).QUANTITY.sum()
+        touched = set()
+        for (sell_id, day, price), quantity in batch.items():
+            sell_id, day, price, quantity = int(sell_id), int(day), float(price), int(quantity)
+            for category, item in self._items.get(sell_id, ()):
+                key = (sell_id, category, item, day, price)
+                old = self._quantities.get(key)
+                new = (old or 0) + quantity
+                self._quantities[key] = new
+                self._update_stats(key, old, new)
+                if self._in_segment(day):
+                    touched.add(product_key(item, sell_id))
+        if len(batch):
+            self._frame = None
+        return touched
+
+    def model(self, key):
+        # Hồi quy QUANTITY ~ PRICE từ thống kê đủ, cùng dạng với mô hình trong registry
+        n, sum_p, sum_q, sum_pp, sum_pq, sum_qq = self.stats[key]
+        intercept, slope = ols_from_sums(n, sum_p, sum_q, sum_pp, sum_pq)
+        intercept, slope = float(intercept), float(slope)
+        df_resid = n - 2
+        rss = sum_qq - intercept * sum_q - slope * sum_pq
+        scale = rss / df_resid if df_resid > 0 else np.nan
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = scale * np.linalg.pinv(np.array([[n, sum_p], [sum_p, sum_pp]]))
+        return LinearModel('QUANTITY ~ PRICE', ['Intercept', 'PRICE'], [intercept, slope], cov,
+                           nobs=n, scale=scale, df_resid=df_resid)
+
+    def models(self):
+        return {key: self.model(key) for key in self.stats}
+
+    def save_registry(self, path):
+        save_registry(path, self.models())
+
+    def combined_data(self):
+        # Dựng lại combined_data (sắp theo sản phẩm rồi ngày, cùng cột và kiểu như bảng đầu vào) khi cần
+        # đọc; được cache đến lô kế tiếp
+        if self._frame is None:
+            intermediate_data = pd.DataFrame(list(self._quantities), columns=KEY_COLUMNS)
+            intermediate_data['QUANTITY'] = list(self._quantities.values())
+            intermediate_data = intermediate_data.sort_values(KEY_COLUMNS, ignore_index=True)
+            frame = pd.merge(intermediate_data, self.date_info, on='DAY')
+            frame['CALENDAR_DATE'] = frame['DAY'].to_numpy().astype('datetime64[D]')
+            frame = frame[list(self._dtypes.index)]
+            for column, dtype in self._dtypes.items():
+                if isinstance(dtype, pd.CategoricalDtype):
+                    # Nhãn suy lại từ dữ liệu: lô mới có thể thêm sản phẩm chưa có trong bảng đầu vào
+                    frame[column] = frame[column].astype(dtype.categories.dtype).astype('category')
+                else:
+                    frame[column] = frame[column].astype(dtype)
+            self._frame = frame
+        return self._frame
+
+    def bau_data(self):
+        return filter_bau(self.combined_data())
+
+
+def append_source(transactions, data_dir=DATA_DIR):
+    # Nối lô vào file giao dịch nguồn theo thứ tự cột và kiểu xuống dòng của file đó (file gốc ghi CRLF
+    # và không có xuống dòng cuối file)
+    path = os.path.join(data_dir, TRANSACTIONS_FILE)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 1))
+        ends_with_newline = f.read() == b'\n'
+    newline = '\r\n' if header.endswith(b'\r\n') else '\n'
+    columns = header.decode().strip().split(',')
+    with open(path, 'a', newline='') as f:
+        if not ends_with_newline:
+            f.write(newline)
+        transactions[columns].to_csv(f, header=False, index=False, lineterminator=newline)
+
+
+def ingest(transactions_path, data_dir=DATA_DIR, manifest_path=MANIFEST_PATH, segments=('bau2',),
+           version=None, activate=True):
+    # Cập nhật mô hình bằng IncrementalStore (không fit lại), ghi registry-<phiên bản>-<phân khúc>.npz,
+    # nối lô vào dữ liệu nguồn rồi mới công bố phiên bản để app thấy dữ liệu và mô hình cùng lúc
+    transactions = pd.read_csv(transactions_path, dtype={'CALENDAR_DATE': str})
+    missing = {'CALENDAR_DATE', 'PRICE', 'QUANTITY', 'SELL_ID', 'SELL_CATEGORY'} - set(transactions.columns)
+    if missing:
+        raise ValueError(f"File giao dịch thiếu cột: {', '.join(sorted(missing))}")
+    manifest = read_manifest(manifest_path)
+    version = version or new_version(manifest)
+    if any(v['version'] == version for v in (manifest or {}).get('versions', [])):
+        raise ValueError(f"Phiên bản '{version}' đã có trong manifest")
+
+    combined_data, _ = load_data(data_dir, typed=True)
+    models_dir = os.path.dirname(manifest_path)
+    entry = {
+        'version': version,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'formula': 'QUANTITY ~ PRICE',
+        'data_fingerprint': None,
+        'typed': True,
+        'ingested': {'file': os.path.basename(transactions_path), 'rows': len(transactions)},
+        'segments': {},
+    }
+    for segment in segments:
+        start = time.perf_counter()
+        store = IncrementalStore(combined_data, data_dir, STORE_SEGMENTS[segment])
+        store.append(transactions)
+        keys = [key for key, stats in store.stats.items() if stats[N] >= MIN_OBSERVATIONS]
+        file_name = f"registry-{version}-{segment}.npz"
+        save_registry(os.path.join(models_dir, file_name), {key: store.model(key) for key in keys})
+        entry['segments'][segment] = {
+            'file': file_name,
+            'products': len(keys),
+            'skipped': [key for key in store.stats if key not in keys],
+            'rows': len(store.combined_data() if segment == 'combined' else store.bau_data()),
+            'seconds': round(time.perf_counter() - start, 3),
+        }
+
+    append_source(transactions, data_dir)
+    entry['data_fingerprint'] = source_fingerprint(source_paths(data_dir))
+    publish_version(entry, manifest_path, activate)
+    return entry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Nạp thêm giao dịch và công bố mô hình cập nhật")
+    parser.add_argument('transactions', help="CSV cùng định dạng 'Cafe - Transaction - Store.csv'")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="Thư mục chứa 3 file CSV nguồn")
+    parser.add_argument('--manifest', default=MANIFEST_PATH, help="Manifest registry (cùng thư mục với registry)")
+    parser.add_argument('--segment', choices=tuple(STORE_SEGMENTS) + ('both',), default='bau2',
+                        help="Phân khúc của registry (bau2 giống các mô hình gốc)")
+    parser.add_argument('--version', help="Tên phiên bản (mặc định: theo thời gian)")
+    parser.add_argument('--no-activate', action='store_true', help="Chỉ ghi phiên bản, không đặt làm hiện tại")
+    args = parser.parse_args(argv)
+    segments = tuple(STORE_SEGMENTS) if args.segment == 'both' else (args.segment,)
+    try:
+        entry = ingest(args.transactions, args.data_dir, args.manifest, segments, args.version,
+                       not args.no_activate)
+    except (ValueError, OSError) as error:
+        parser.error(str(error))
+    print(f"Đã nạp {entry['ingested']['rows']} dòng giao dịch")
+    for segment, info in entry['segments'].items():
+        print(f"[{segment}] {info['products']} mô hình, bỏ qua {len(info['skipped'])}, "
+              f"{info['seconds']}s -> {info['file']}")
+    print(f"Phiên bản {entry['version']}" + ("" if args.no_activate else " (đang dùng)"))
+
+
+if __name__ == '__main__':
+    main()
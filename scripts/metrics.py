@@ -0,0 +1,147 @@
+import functools
+import json
+import os
+import threading
+import time
+
+# Đo số lần gọi, histogram độ trễ và số dòng xử lý của các hàm trong scripts.
+# Bật bằng biến môi trường PRICING_METRICS=1 (hoặc enable()); khi tắt, mỗi lần gọi chỉ tốn
+# thêm một phép kiểm tra cờ.
+ENV_VAR = 'PRICING_METRICS'
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = os.environ.get(ENV_VAR, '').lower() not in ('', '0', 'false', 'no')
+_lock = threading.Lock()
+_metrics = {}
+
+
+class _Metric:
+    __slots__ = ('calls', 'errors', 'rows', 'seconds', 'buckets')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = bool(flag)
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _metrics.clear()
+
+
+def _count_rows(values):
+    # Số dòng của DataFrame (hoặc ProductIndex) đầu tiên tìm thấy
+    for value in values:
+        data = getattr(value, 'data', None) if not hasattr(value, 'columns') else value
+        if hasattr(data, 'columns'):
+            return len(data)
+    return 0
+
+
+def record(name, seconds, rows=0, error=False):
+    bucket = len(LATENCY_BUCKETS)
+    for i, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            bucket = i
+            break
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = _Metric()
+        metric.calls += 1
+        metric.errors += error
+        metric.rows += rows
+        metric.seconds += seconds
+        metric.buckets[bucket] += 1
+
+
+def instrument(name=None, rows='args'):
+    # rows='args': đếm dòng của DataFrame đầu vào đầu tiên; 'result': của kết quả; None: không đếm
+    def decorator(fn):
+        label = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception:
+                record(label, time.perf_counter() - start, error=True)
+                raise
+            elapsed = time.perf_counter() - start
+            if rows == 'args':
+                count = _count_rows(list(args) + list(kwargs.values()))
+            elif rows == 'result':
+                count = _count_rows(result if isinstance(result, tuple) else (result,))
+            else:
+                count = 0
+            record(label, elapsed, count)
+            return result
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    # Bản sao số liệu hiện tại: {tên hàm: {calls, errors, rows, seconds, mean_seconds, buckets}}
+    with _lock:
+        return {
+            name: {
+                'calls': metric.calls,
+                'errors': metric.errors,
+                'rows': metric.rows,
+                'seconds': metric.seconds,
+                'mean_seconds': metric.seconds / metric.calls if metric.calls else 0.0,
+                'buckets': dict(zip([str(bound) for bound in LATENCY_BUCKETS] + ['+Inf'], metric.buckets)),
+            }
+            for name, metric in sorted(_metrics.items())
+        }
+
+
+def to_json():
+    return json.dumps({'buckets': LATENCY_BUCKETS, 'metrics': snapshot()}, indent=2)
+
+
+def to_prometheus(prefix='pricing'):
+    # Định dạng văn bản của Prometheus; bucket histogram là số tích lũy
+    lines = [
+        f'# HELP {prefix}_calls_total Số lần gọi hàm.',
+        f'# TYPE {prefix}_calls_total counter',
+    ]
+    metrics = snapshot()
+    for name, metric in metrics.items():
+        lines.append(f'{prefix}_calls_total{{function="{name}"}} {metric["calls"]}')
+    lines += [f'# HELP {prefix}_errors_total Số lần gọi lỗi.', f'# TYPE {prefix}_errors_total counter']
+    for name, metric in metrics.items():
+        lines.append(f'{prefix}_errors_total{{function="{name}"}} {metric["errors"]}')
+    lines += [f'# HELP {prefix}_rows_total Số dòng dữ liệu đã xử lý.', f'# TYPE {prefix}_rows_total counter']
+    for name, metric in metrics.items():
+        lines.append(f'{prefix}_rows_total{{function="{name}"}} {metric["rows"]}')
+    lines += [f'# HELP {prefix}_latency_seconds Độ trễ của hàm.', f'# TYPE {prefix}_latency_seconds histogram']
+    for name, metric in metrics.items():
+        cumulative = 0
+        for bound, count in metric['buckets'].items():
+            cumulative += count
+            lines.append(f'{prefix}_latency_seconds_bucket{{function="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'{prefix}_latency_seconds_sum{{function="{name}"}} {metric["seconds"]}')
+        lines.append(f'{prefix}_latency_seconds_count{{function="{name}"}} {metric["calls"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def dump(path):
+    # Ghi ra file: .prom/.txt theo định dạng Prometheus, còn lại JSON
+    text = to_prometheus() if path.endswith(('.prom', '.txt')) else to_json()
+    with open(path, 'w') as f:
+        f.write(text)
@@ -0,0 +1,312 @@
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+from .metrics import instrument
+from .products import ProductIndex, split_product_key
+from .regression import ols_from_sums, sufficient_stats
+
+# Số điểm lưới và số vòng thu hẹp cho tìm kiếm số (mô hình không tuyến tính)
+GRID_POINTS = 201
+REFINE_ROUNDS = 4
+
+
+def model_formula(model):
+    # Lấy công thức của mô hình (kết quả statsmodels hoặc mô hình nhẹ có thuộc tính formula)
+    formula = getattr(model, 'formula', None)
+    if formula is None:
+        formula = getattr(getattr(model, 'model', None), 'formula', None)
+    return formula
+
+
+def linear_coefficients(model):
+    # Trả về (hệ số chặn, hệ số giá) nếu mô hình đúng dạng QUANTITY ~ PRICE, ngược lại None
+    formula = model_formula(model)
+    if formula is None or formula.replace(' ', '') != 'QUANTITY~PRICE':
+        return None
+    params = model.params
+    return float(params['Intercept']), float(params['PRICE'])
+
+
+def price_bounds(lowest, highest, buying_price):
+    # Khoảng tìm kiếm mặc định: bao trọn cửa sổ cũ (min-1, min+10) và rộng hơn giá đã bán
+    highest = max(highest, buying_price)
+    return max(0.0, min(lowest - 1, buying_price)), max(lowest + 10, highest * 2 + 10)
+
+
+def default_bounds(data, buying_price):
+    return price_bounds(data.PRICE.min(), data.PRICE.max(), buying_price)
+
+
+@instrument(rows=None)
+def predict_quantities(model, prices):
+    quantities = model.predict(pd.DataFrame({'PRICE': prices}))
+    return np.asarray(quantities, dtype=float)
+
+
+def bounded_search(model, buying_price, low, high, points=GRID_POINTS, rounds=REFINE_ROUNDS):
+    # Quét lưới thưa rồi thu hẹp quanh điểm tốt nhất, mỗi vòng chỉ gọi predict một lần
+    for _ in range(rounds):
+        prices = np.linspace(low, high, points)
+        quantities = predict_quantities(model, prices)
+        profits = (prices - buying_price) * quantities
+        ind = int(np.nanargmax(profits))
+        step = (high - low) / (points - 1)
+        low, high = max(low, prices[ind] - step), min(high, prices[ind] + step)
+    return prices[ind], quantities[ind], profits[ind]
+
+
+def optimal_linear_price(intercept, slope, buying_price, low=-np.inf, high=np.inf):
+    # Lợi nhuận (P - c)(a + bP) là parabol lõm khi b < 0, cực đại tại P = (bc - a) / 2b.
+    # Hàm lõm nên kẹp nghiệm vào [low, high] vẫn cho cực đại trên đoạn. Dùng được cho mảng.
+    price = np.clip((slope * buying_price - intercept) / (2 * slope), low, high)
+    quantity = intercept + slope * price
+    return price, quantity, (price - buying_price) * quantity
+
+
+@instrument()
+def find_optimal_price(data, model, buying_price, bounds=None):
+    coefficients = linear_coefficients(model)
+    if coefficients is not None and coefficients[1] < 0:
+        low, high = bounds if bounds is not None else (-np.inf, np.inf)
+        price, quantity, profit = optimal_linear_price(*coefficients, buying_price, low, high)
+    else:
+        low, high = bounds if bounds is not None else default_bounds(data, buying_price)
+        price, quantity, profit = bounded_search(model, buying_price, low, high)
+    return pd.DataFrame({'PRICE': [float(price)],
+                         'QUANTITY': [float(quantity)],
+                         'PROFIT': [float(profit)]})
+
+
+def _buying_price_vector(keys, buying_prices, default):
+    if isinstance(buying_prices, Mapping):
+        return np.array([buying_prices.get(key, default) for key in keys], dtype=float)
+    if np.ndim(buying_prices) == 0:
+        return np.full(len(keys), float(buying_prices))
+    return np.asarray(buying_prices, dtype=float)
+
+
+@instrument()
+def optimize_portfolio(data, models, buying_prices, default_buying_price=9.0):
+    # Tối ưu đồng thời mọi sản phẩm (ITEM_NAME, SELL_ID) trong models bằng phép tính trên mảng.
+    # buying_prices: dict theo khóa sản phẩm, một số, hoặc mảng theo thứ tự models.
+    keys = list(models)
+    items, sell_ids = zip(*(split_product_key(key) for key in keys)) if keys else ((), ())
+    costs = _buying_price_vector(keys, buying_prices, default_buying_price)
+
+    stats = sufficient_stats(data).reindex(pd.MultiIndex.from_arrays([items, sell_ids]))
+    n = stats['N'].fillna(0).to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        current_price = stats['SUM_P'].to_numpy() / n
+    _, elasticity = ols_from_sums(n, stats['SUM_P'], stats['SUM_Q'], stats['SUM_PP'], stats['SUM_PQ'])
+
+    coefficients = [linear_coefficients(models[key]) for key in keys]
+    linear = np.array([c is not None and c[1] < 0 for c in coefficients], dtype=bool)
+    intercepts = np.array([c[0] if c is not None else np.nan for c in coefficients], dtype=float)
+    slopes = np.array([c[1] if c is not None else np.nan for c in coefficients], dtype=float)
+
+    price, quantity, profit = (np.full(len(keys), np.nan) for _ in range(3))
+    if linear.any():
+        price[linear], quantity[linear], profit[linear] = optimal_linear_price(
+            intercepts[linear], slopes[linear], costs[linear])
+
+    # Mô hình không tuyến tính (hoặc cầu không giảm theo giá): tìm kiếm số từng sản phẩm
+    lowest, highest = stats['MIN_P'].to_numpy(), stats['MAX_P'].to_numpy()
+    for i in np.flatnonzero(~linear):
+        low = lowest[i] if n[i] else costs[i]
+        high = highest[i] if n[i] else costs[i]
+        price[i], quantity[i], profit[i] = bounded_search(
+            models[keys[i]], costs[i], *price_bounds(low, high, costs[i]))
+
+    return pd.DataFrame({
+        'PRODUCT': keys,
+        'ITEM_NAME': list(items),
+        'SELL_ID': list(sell_ids),
+        'N': n.astype(int),
+        'BUYING_PRICE': costs,
+        'CURRENT_PRICE': current_price,
+        'PRICE': price,
+        'QUANTITY': quantity,
+        'PROFIT': profit,
+        'ELASTICITY': elasticity,
+        'ADJUSTMENT': price - current_price,
+    })
+
+
+def adjustment_records(portfolio):
+    # Chuyển kết quả optimize_portfolio sang định dạng của calculate_adjustment
+    records = []
+    for row in portfolio.itertuples(index=False):
+        if not row.N:
+            continue
+        records.append({
+            'Sản phẩm': row.PRODUCT,
+            'Giá hiện tại': round(row.CURRENT_PRICE, 2),
+            'Giá tối ưu': round(row.PRICE, 2),
+            'Độ co giãn': round(row.ELASTICITY, 2) if not pd.isna(row.ELASTICITY) else "N/A",
+            'Đề xuất': 'Tăng' if row.ADJUSTMENT > 0 else 'Giảm',
+            'Thay đổi': round(abs(row.ADJUSTMENT), 2)
+        })
+    return records
+
+
+# Combo: lưới đầy đủ (meshgrid) cho combo nhỏ, phân rã đối ngẫu cho combo lớn
+MESHGRID_MAX_ITEMS = 3
+COMBO_GRID_POINTS = 41
+COMBO_REFINE_ROUNDS = 6
+DUAL_GRID_POINTS = 2001
+DUAL_BISECTION_STEPS = 60
+
+
+def _combo_bounds(keys, models, costs, bounds, data):
+    result = []
+    for key, cost in zip(keys, costs):
+        if bounds is not None and key in bounds:
+            result.append(tuple(bounds[key]))
+            continue
+        if data is not None:
+            product_data = data.product(key) if isinstance(data, ProductIndex) else \
+                data[(data['ITEM_NAME'] == split_product_key(key)[0]) & (data['SELL_ID'] == split_product_key(key)[1])]
+            if not product_data.empty:
+                result.append(default_bounds(product_data, cost))
+                continue
+        coefficients = linear_coefficients(models[key])
+        if coefficients is None or coefficients[1] >= 0:
+            raise ValueError(f"Cần bounds hoặc data để xác định khoảng giá cho {key}")
+        # Cầu tuyến tính giảm: giá có nghĩa nằm giữa 0 và mức giá làm số lượng về 0
+        result.append((0.0, max(cost, -coefficients[0] / coefficients[1])))
+    return result
+
+
+def _feasible(total, min_total, max_total):
+    feasible = np.ones(np.shape(total), dtype=bool)
+    if min_total is not None:
+        feasible &= total >= min_total - 1e-9
+    if max_total is not None:
+        feasible &= total <= max_total + 1e-9
+    return feasible
+
+
+def _last_item_candidates(model, cost, low, high, others_total, unconstrained, min_total, max_total):
+    # Với mỗi tổ hợp giá của các sản phẩm còn lại, giá sản phẩm cuối được ràng buộc tổng giá cắt
+    # vào đoạn [lo, hi]; ứng viên là hai đầu đoạn và giá tối ưu riêng kẹp vào đoạn (đúng cực đại
+    # khi lợi nhuận lõm). Nhờ vậy ràng buộc bằng (min_total == max_total) vẫn có nghiệm trên lưới.
+    lo = np.maximum(low, min_total - others_total) if min_total is not None else np.full(np.shape(others_total), low)
+    hi = np.minimum(high, max_total - others_total) if max_total is not None else np.full(np.shape(others_total), high)
+    feasible = lo <= hi + 1e-9
+    hi = np.maximum(lo, hi)
+    candidates = np.stack([lo, hi, np.clip(unconstrained, lo, hi)])
+    profits = (candidates - cost) * predict_quantities(model, candidates.ravel()).reshape(candidates.shape)
+    profits = np.where(feasible & ~np.isnan(profits), profits, -np.inf)
+    choice = np.argmax(profits, axis=0)
+    return np.take_along_axis(candidates, choice[None], 0)[0], np.take_along_axis(profits, choice[None], 0)[0]
+
+
+def _meshgrid_search(models, costs, bounds, min_total, max_total):
+    # Đánh giá toàn bộ lưới giá chung; mỗi vòng gọi predict một lần cho mỗi sản phẩm rồi thu hẹp.
+    # Khi có ràng buộc tổng giá, điểm lưới tốt nhất còn được so với phép chiếu lên ràng buộc:
+    # sản phẩm cuối lấy giá từ phần tổng còn lại (_last_item_candidates).
+    constrained = min_total is not None or max_total is not None
+    if constrained:
+        unconstrained = bounded_search(models[-1], costs[-1], *bounds[-1])[0]
+    windows = [np.linspace(low, high, COMBO_GRID_POINTS) for low, high in bounds]
+    best = None
+    for _ in range(COMBO_REFINE_ROUNDS):
+        profits = [(grid - cost) * predict_quantities(model, grid)
+                   for model, grid, cost in zip(models, windows, costs)]
+        mesh_profit = sum(np.ix_(*profits))
+        mesh_total = sum(np.ix_(*windows))
+        mesh_profit = np.where(_feasible(mesh_total, min_total, max_total) & ~np.isnan(mesh_profit),
+                               mesh_profit, -np.inf)
+        flat = int(np.argmax(mesh_profit))
+        best_profit = mesh_profit.flat[flat]
+        best = [grid[i] for grid, i in zip(windows, np.unravel_index(flat, mesh_profit.shape))]
+        if constrained:
+            others_total = np.asarray(sum(np.ix_(*windows[:-1])) if len(windows) > 1 else 0.0, dtype=float)
+            others_profit = np.asarray(sum(np.ix_(*profits[:-1])) if len(windows) > 1 else 0.0, dtype=float)
+            last_price, last_profit = _last_item_candidates(models[-1], costs[-1], *bounds[-1], others_total,
+                                                            unconstrained, min_total, max_total)
+            projected = np.where(np.isnan(others_profit), -np.inf, others_profit + last_profit)
+            flat = int(np.argmax(projected))
+            if projected.flat[flat] > best_profit:
+                best_profit = projected.flat[flat]
+                best = [grid[i] for grid, i in zip(windows[:-1], np.unravel_index(flat, projected.shape))]
+                best.append(last_price.flat[flat])
+        if not np.isfinite(best_profit):
+            raise ValueError("Không có tổ hợp giá nào thỏa ràng buộc tổng giá combo")
+        new_windows = []
+        for grid, price, (low, high) in zip(windows, best, bounds):
+            step = grid[1] - grid[0] if len(grid) > 1 else 0.0
+            # Giữ điểm tốt nhất trong lưới mới để kết quả không bao giờ tệ đi
+            new_windows.append(np.union1d(
+                np.linspace(max(low, price - 2 * step), min(high, price + 2 * step), COMBO_GRID_POINTS), [price]))
+        windows = new_windows
+    return np.array(best)
+
+
+def _dual_search(models, costs, bounds, min_total, max_total):
+    # Lợi nhuận tách được theo sản phẩm nên ràng buộc tổng giá được xử lý bằng nhân tử Lagrange λ:
+    # mỗi sản phẩm tối đa hóa π_i(P) - λP độc lập, rồi chia đôi λ đến khi tổng giá thỏa ràng buộc
+    grids = np.array([np.linspace(low, high, DUAL_GRID_POINTS) for low, high in bounds])
+    profits = np.array([(grid - cost) * predict_quantities(model, grid)
+                        for model, grid, cost in zip(models, grids, costs)])
+    profits = np.where(np.isnan(profits), -np.inf, profits)
+    rows = np.arange(len(grids))
+
+    def prices_at(multiplier):
+        return grids[rows, np.argmax(profits - multiplier * grids, axis=1)]
+
+    prices = prices_at(0.0)
+    total = prices.sum()
+    if _feasible(total, min_total, max_total):
+        return prices
+    target, sign = (max_total, 1.0) if max_total is not None and total > max_total else (min_total, -1.0)
+
+    def reached(total):
+        # Chỉ xét phía ràng buộc đang bị vi phạm; điểm lưới hiếm khi rơi đúng vào đoạn hẹp
+        return total <= target + 1e-9 if sign > 0 else total >= target - 1e-9
+
+    if not reached(grids[:, 0 if sign > 0 else -1].sum()):
+        raise ValueError("Không có tổ hợp giá nào thỏa ràng buộc tổng giá combo")
+    low, high = 0.0, 1.0
+    while not reached(prices_at(sign * high).sum()):
+        low, high = high, high * 2
+    for _ in range(DUAL_BISECTION_STEPS):
+        middle = (low + high) / 2
+        if reached(prices_at(sign * middle).sum()):
+            high = middle
+        else:
+            low = middle
+    # Ràng buộc bị vi phạm tại λ = 0 nên nghiệm nằm trên biên; tổng giá nhảy bậc theo λ, nên nội suy
+    # giữa hai nghiệm kẹp hai bên để tổng giá đúng bằng target thay vì trả về một đỉnh lưới
+    prices, outside = prices_at(sign * high), prices_at(sign * low)
+    weight = (outside.sum() - target) / (outside.sum() - prices.sum())
+    return outside + weight * (prices - outside)
+
+
+@instrument()
+def optimize_combo(models, buying_prices, bounds=None, min_total=None, max_total=None,
+                   data=None, default_buying_price=9.0):
+    # Tối ưu đồng thời giá các sản phẩm trong một combo.
+    # models: {khóa sản phẩm: mô hình}; bounds: {khóa: (thấp, cao)} cho từng sản phẩm;
+    # min_total/max_total: ràng buộc tổng giá combo; data (DataFrame hoặc ProductIndex) dùng
+    # để suy ra khoảng giá mặc định khi không truyền bounds.
+    if min_total is not None and max_total is not None and min_total > max_total + 1e-9:
+        raise ValueError("min_total lớn hơn max_total")
+    keys = list(models)
+    costs = _buying_price_vector(keys, buying_prices, default_buying_price)
+    item_bounds = _combo_bounds(keys, models, costs, bounds, data)
+    item_models = [models[key] for key in keys]
+    if len(keys) <= MESHGRID_MAX_ITEMS:
+        prices = _meshgrid_search(item_models, costs, item_bounds, min_total, max_total)
+    else:
+        prices = _dual_search(item_models, costs, item_bounds, min_total, max_total)
+    quantities = np.array([predict_quantities(model, [price])[0] for model, price in zip(item_models, prices)])
+    return pd.DataFrame({
+        'PRODUCT': keys,
+        'BUYING_PRICE': costs,
+        'PRICE': prices,
+        'QUANTITY': quantities,
+        'PROFIT': (prices - costs) * quantities,
+    })
@@ -0,0 +1,76 @@
+import numpy as np
+from .metrics import instrument
+
+
+# Khóa sản phẩm dạng "<item>_<sell_id>", ví dụ "burger_1070", như tên file trong models/
+def product_key(item_name, sell_id):
+    return f"{str(item_name).lower()}_{int(sell_id)}"
+
+
+def split_product_key(key):
+    item_name, sell_id = key.rsplit('_', 1)
+    return item_name.upper(), int(sell_id)
+
+
+SEGMENT_COLUMNS = ['HOLIDAY', 'IS_WEEKEND', 'IS_SCHOOLBREAK']
+
+
+class ProductIndex:
+    # Chỉ mục dựng một lần trên combined_data/bau2_data: vị trí dòng theo sản phẩm,
+    # theo ô (HOLIDAY, IS_WEEKEND, IS_SCHOOLBREAK) của từng sản phẩm, và danh mục lẻ/combo.
+    # Tra cứu không phải quét lại toàn bộ bảng như khi lọc bằng mặt nạ boolean.
+
+    @instrument()
+    def __init__(self, data):
+        self.data = data
+        groups = data.groupby(['ITEM_NAME', 'SELL_ID'], observed=True, sort=False).indices
+        self._rows = {product_key(item, sell_id): rows for (item, sell_id), rows in groups.items()}
+
+        cells = data.groupby(['ITEM_NAME', 'SELL_ID'] + SEGMENT_COLUMNS, observed=True, sort=False).indices
+        self._segments = {}
+        for (item, sell_id, *cell), rows in cells.items():
+            self._segments.setdefault(product_key(item, sell_id), {})[tuple(cell)] = rows
+
+        # Danh mục: SELL_ID có nhiều sản phẩm là combo, còn lại là bán lẻ (theo thứ tự xuất hiện)
+        first_row = {key: rows[0] for key, rows in self._rows.items()}
+        items_by_sell_id = {}
+        for (item, sell_id), rows in sorted(groups.items(), key=lambda group: group[1][0]):
+            items_by_sell_id.setdefault(int(sell_id), []).append(item)
+        self.single_products = []
+        self.combos = {}
+        for sell_id, items in items_by_sell_id.items():
+            if len(items) > 1:
+                self.combos[sell_id] = items
+            else:
+                self.single_products.append(product_key(items[0], sell_id))
+        self._order = sorted(first_row, key=first_row.get)
+        self.holidays = list(data['HOLIDAY'].unique())
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def keys(self):
+        return list(self._order)
+
+    def rows(self, key, holiday=None, weekend=None, schoolbreak=None):
+        # Vị trí dòng của sản phẩm, có thể lọc theo ngày lễ/cuối tuần/kỳ nghỉ học (None = tất cả)
+        if holiday is None and weekend is None and schoolbreak is None:
+            return self._rows.get(key, np.empty(0, dtype=np.intp))
+        selected = [rows for (cell_holiday, cell_weekend, cell_schoolbreak), rows
+                    in self._segments.get(key, {}).items()
+                    if (holiday is None or cell_holiday == holiday)
+                    and (weekend is None or cell_weekend == weekend)
+                    and (schoolbreak is None or cell_schoolbreak == schoolbreak)]
+        if not selected:
+            return np.empty(0, dtype=np.intp)
+        return np.sort(np.concatenate(selected))
+
+    def product(self, key):
+        return self.data.iloc[self.rows(key)]
+
+    @instrument(rows='result')
+    def segment(self, key, holiday=None, weekend=None, schoolbreak=None):
+        return self.data.iloc[self.rows(key, holiday, weekend, schoolbreak)]
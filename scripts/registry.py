@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import pickle
+import time
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+# Sổ đăng ký mô hình gọn: một file .npz chứa công thức, hệ số và ma trận hiệp phương sai
+# của mọi sản phẩm. Dự đoán bằng NumPy, không cần import statsmodels khi khởi động.
+REGISTRY_PATH = 'models/registry.npz'
+# Manifest do scripts.train ghi: các phiên bản registry và phiên bản đang dùng
+MANIFEST_PATH = 'models/manifest.json'
+DEFAULT_SEGMENT = 'bau2'
+# Optimizer, kịch bản và app chỉ dự đoán từ bảng có một cột PRICE, nên mô hình dùng được phải là
+# QUANTITY theo PRICE (có hoặc không có hệ số chặn)
+PRICING_RESPONSE = 'QUANTITY'
+PRICING_TERMS = ('Intercept', 'PRICE')
+
+
+def check_exog_names(formula, exog_names):
+    # Registry chỉ lưu được số hạng là tên cột (không có phép biến đổi như np.log(PRICE))
+    for name in exog_names:
+        if name != 'Intercept' and not name.isidentifier():
+            raise ValueError(f"Không hỗ trợ số hạng '{name}' trong công thức '{formula}'")
+
+
+def check_pricing_terms(formula, endog_name, exog_names):
+    # Lỗi nếu app không đánh giá được mô hình (thiếu PRICE, thêm biến khác, hoặc biến phụ thuộc khác QUANTITY)
+    extra = [name for name in exog_names if name not in PRICING_TERMS]
+    if endog_name != PRICING_RESPONSE or 'PRICE' not in exog_names or extra:
+        raise ValueError(f"Công thức '{formula}' không dùng được để định giá: cần {PRICING_RESPONSE} theo PRICE, "
+                         f"không có biến khác" + (f" (thừa {', '.join(extra)})" if extra else ""))
+
+
+class LinearModel:
+    # Mô hình tuyến tính chỉ giữ hệ số; predict/params/cov_params tương thích kết quả OLS của statsmodels
+
+    def __init__(self, formula, exog_names, params, cov, nobs=np.nan, scale=np.nan, df_resid=np.nan):
+        check_exog_names(formula, exog_names)
+        self.formula = formula
+        self.exog_names = list(exog_names)
+        self.params = pd.Series(np.asarray(params, dtype=float), index=self.exog_names)
+        self._cov = np.asarray(cov, dtype=float)
+        self.nobs = float(nobs)
+        self.scale = float(scale)
+        self.df_resid = float(df_resid)
+
+    @classmethod
+    def from_results(cls, results):
+        # Chuyển kết quả statsmodels (đã unpickle) sang dạng chỉ hệ số
+        return cls(results.model.formula, results.model.exog_names, results.params.values,
+                   results.cov_params().values, results.nobs, results.scale, results.df_resid)
+
+    def cov_params(self):
+        return pd.DataFrame(self._cov, index=self.exog_names, columns=self.exog_names)
+
+    def design_matrix(self, exog):
+        # Ma trận thiết kế theo exog_names; mảng/số trần được hiểu là biến hồi quy duy nhất (PRICE)
+        if isinstance(exog, pd.Series):
+            exog = exog.to_frame()
+        elif isinstance(exog, Mapping):
+            exog = pd.DataFrame(exog)
+        if not isinstance(exog, pd.DataFrame):
+            regressors = [name for name in self.exog_names if name != 'Intercept']
+            if len(regressors) != 1:
+                raise ValueError("Cần DataFrame có đủ các cột của mô hình")
+            exog = pd.DataFrame({regressors[0]: np.atleast_1d(np.asarray(exog, dtype=float))})
+        columns = [np.ones(len(exog)) if name == 'Intercept' else exog[name].to_numpy(dtype=float)
+                   for name in self.exog_names]
+        return np.column_stack(columns), exog.index
+
+    def predict(self, exog):
+        design, index = self.design_matrix(exog)
+        prediction = design @ self.params.to_numpy()
+        if isinstance(exog, (pd.DataFrame, pd.Series, Mapping)):
+            return pd.Series(prediction, index=index)
+        return prediction
+
+    def __repr__(self):
+        return f"LinearModel({self.formula!r}, {dict(self.params)})"
+
+
+class ModelRegistry(Mapping):
+    # Đọc registry theo khóa sản phẩm; mỗi mô hình chỉ được dựng khi được truy cập lần đầu
+
+    def __init__(self, path=REGISTRY_PATH):
+        self.path = path
+        self._arrays = None
+        self._positions = None
+        self._models = {}
+
+    def _load(self):
+        if self._arrays is None:
+            with np.load(self.path, allow_pickle=False) as f:
+                self._arrays = {name: f[name] for name in f.files}
+            self._positions = {str(key): i for i, key in enumerate(self._arrays['keys'])}
+        return self._arrays
+
+    def __getitem__(self, key):
+        if key not in self._models:
+            arrays = self._load()
+            i = self._positions[key]
+            k = int(arrays['n_params'][i])
+            self._models[key] = LinearModel(
+                str(arrays['formulas'][i]),
+                [str(name) for name in arrays['exog_names'][i, :k]],
+                arrays['params'][i, :k],
+                arrays['cov'][i, :k, :k],
+                arrays['nobs'][i], arrays['scale'][i], arrays['df_resid'][i])
+        return self._models[key]
+
+    def __iter__(self):
+        self._load()
+        return iter(self._positions)
+
+    def __len__(self):
+        self._load()
+        return len(self._positions)
+
+    def __getstate__(self):
+        # Khi bị pickle (ví dụ st.cache_data), chỉ mang theo đường dẫn
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+
+def save_registry(path, models):
+    # Ghi một dict {khóa: LinearModel hoặc kết quả statsmodels} thành một file .npz
+    models = {key: model if isinstance(model, LinearModel) else LinearModel.from_results(model)
+              for key, model in models.items()}
+    size = max((len(model.exog_names) for model in models.values()), default=0)
+    count = len(models)
+    exog_names = np.full((count, size), '', dtype=object)
+    params = np.full((count, size), np.nan)
+    cov = np.full((count, size, size), np.nan)
+    for i, model in enumerate(models.values()):
+        k = len(model.exog_names)
+        exog_names[i, :k] = model.exog_names
+        params[i, :k] = model.params.to_numpy()
+        cov[i, :k, :k] = model._cov
+    np.savez(path,
+             keys=np.array(list(models), dtype=str),
+             formulas=np.array([model.formula for model in models.values()], dtype=str),
+             exog_names=exog_names.astype(str),
+             n_params=np.array([len(model.exog_names) for model in models.values()], dtype=np.int64),
+             params=params,
+             cov=cov,
+             nobs=np.array([model.nobs for model in models.values()]),
+             scale=np.array([model.scale for model in models.values()]),
+             df_resid=np.array([model.df_resid for model in models.values()]))
+
+
+def load_registry(path=REGISTRY_PATH):
+    return ModelRegistry(path)
+
+
+def read_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def new_version(manifest):
+    # Phiên bản theo thời gian; thêm hậu tố nếu trùng với phiên bản đã có
+    version = time.strftime('%Y%m%d-%H%M%S')
+    existing = {v['version'] for v in (manifest or {}).get('versions', [])}
+    candidate, suffix = version, 1
+    while candidate in existing:
+        suffix += 1
+        candidate = f"{version}-{suffix}"
+    return candidate
+
+
+def publish_version(entry, manifest_path=MANIFEST_PATH, activate=True):
+    # Thêm một phiên bản (các file registry đã ghi xong) vào manifest; ghi file tạm rồi os.replace
+    # để app và scripts.batch không bao giờ đọc phải manifest ghi dở
+    manifest = read_manifest(manifest_path) or {'current': None, 'versions': []}
+    if any(v['version'] == entry['version'] for v in manifest['versions']):
+        raise ValueError(f"Phiên bản '{entry['version']}' đã có trong manifest")
+    manifest['versions'].append(entry)
+    if activate:
+        manifest['current'] = entry['version']
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def current_registry_path(manifest_path=MANIFEST_PATH, segment=DEFAULT_SEGMENT):
+    # Registry của phiên bản hiện tại trong manifest; không có manifest thì dùng models/registry.npz
+    manifest = read_manifest(manifest_path)
+    if not manifest:
+        return REGISTRY_PATH
+    version = next(v for v in manifest['versions'] if v['version'] == manifest['current'])
+    segments = version['segments']
+    entry = segments.get(segment) or next(iter(segments.values()))
+    return os.path.join(os.path.dirname(manifest_path), entry['file'])
+
+
+def convert_pickles(paths, output=REGISTRY_PATH):
+    # Chuyển các file .pkl (kết quả statsmodels) sang registry; khóa là tên file không đuôi
+    models = {}
+    for path in paths:
+        with open(path, 'rb') as f:
+            models[os.path.splitext(os.path.basename(path))[0]] = LinearModel.from_results(pickle.load(f))
+    save_registry(output, models)
+    return models
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chuyển các mô hình .pkl sang registry .npz")
+    parser.add_argument('pickles', nargs='+', help="Các file .pkl của statsmodels")
+    parser.add_argument('-o', '--output', default=REGISTRY_PATH, help="File registry đầu ra")
+    args = parser.parse_args(argv)
+    models = convert_pickles(args.pickles, args.output)
+    print(f"Đã ghi {len(models)} mô hình vào {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+PRODUCT_COLUMNS = ['ITEM_NAME', 'SELL_ID']
+SUM_COLUMNS = ['N', 'SUM_P', 'SUM_Q', 'SUM_PP', 'SUM_PQ', 'SUM_QQ']
+
+
+def sufficient_stats(data, by=PRODUCT_COLUMNS):
+    # Thống kê đủ của hồi quy QUANTITY ~ PRICE theo nhóm: n, ΣP, ΣQ, ΣP², ΣPQ, ΣQ²
+    price = data['PRICE'].astype(float)
+    quantity = data['QUANTITY'].astype(float)
+    frame = pd.DataFrame({
+        'N': np.ones(len(data)),
+        'SUM_P': price,
+        'SUM_Q': quantity,
+        'SUM_PP': price * price,
+        'SUM_PQ': price * quantity,
+        'SUM_QQ': quantity * quantity,
+        'MIN_P': price,
+        'MAX_P': price,
+    })
+    for column in by:
+        frame[column] = data[column].values
+    grouped = frame.groupby(by, observed=True, sort=False)
+    stats = grouped[SUM_COLUMNS].sum()
+    stats['MIN_P'] = grouped['MIN_P'].min()
+    stats['MAX_P'] = grouped['MAX_P'].max()
+    return stats
+
+
+def ols_from_sums(n, sum_p, sum_q, sum_pp, sum_pq):
+    # Hệ số chặn và hệ số góc của QUANTITY ~ PRICE từ các tổng; NaN khi không đủ dữ liệu
+    n, sum_p, sum_q, sum_pp, sum_pq = (np.asarray(v, dtype=float)
+                                      for v in (n, sum_p, sum_q, sum_pp, sum_pq))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = n * sum_pp - sum_p * sum_p
+        slope = (n * sum_pq - sum_p * sum_q) / denominator
+        slope = np.where((n >= 2) & (np.abs(denominator) > 1e-12 * np.maximum(n * sum_pp, 1.0)),
+                         slope, np.nan)
+        intercept = (sum_q - slope * sum_p) / n
+    return intercept, slope
@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+
+from .metrics import instrument
+from .optimizer import _buying_price_vector, default_bounds, linear_coefficients, price_bounds
+from .products import ProductIndex, split_product_key
+from .regression import sufficient_stats
+
+# Rủi ro lợi nhuận theo độ bất định của hệ số hồi quy: rút mẫu (hệ số chặn, hệ số giá) từ phân phối
+# chuẩn N(params, cov_params) của mô hình OLS, tính số lượng/lợi nhuận trên cả lưới giá trong một
+# phép broadcast. Số lượng âm được cắt về 0 nên phân phối lợi nhuận không còn chuẩn.
+# Mọi sản phẩm dùng chung một bộ mẫu chuẩn hóa (cùng seed), nên kết quả của một sản phẩm không
+# phụ thuộc vào việc tính riêng hay cùng cả danh mục.
+DEFAULT_SAMPLES = 2000
+RISK_GRID_POINTS = 201
+DEFAULT_QUANTILES = (0.05, 0.5, 0.95)
+# Giá điều chỉnh theo rủi ro: tối đa hóa phân vị này của lợi nhuận (5% = lợi nhuận đạt được với xác suất 95%)
+RISK_QUANTILE = 0.05
+DEFAULT_SEED = 0
+# Giới hạn số phần tử của mảng (sản phẩm × mẫu × mức giá) trong một lượt tính
+MAX_ELEMENTS = 2 ** 24
+PARAMETER_NAMES = ['Intercept', 'PRICE']
+
+
+def quantile_column(q):
+    return f"PROFIT_Q{round(q * 100):02d}"
+
+
+def linear_parameters(model):
+    # Trung bình và ma trận hiệp phương sai của (hệ số chặn, hệ số giá); chỉ cho mô hình QUANTITY ~ PRICE
+    if linear_coefficients(model) is None:
+        raise ValueError("Mô phỏng rủi ro chỉ hỗ trợ mô hình QUANTITY ~ PRICE")
+    cov = model.cov_params()
+    return (np.asarray(model.params[PARAMETER_NAMES], dtype=float),
+            np.asarray(cov.loc[PARAMETER_NAMES, PARAMETER_NAMES], dtype=float))
+
+
+def covariance_factors(covs):
+    # L với L Lᵀ = cov cho từng ma trận (..., k, k); dùng trị riêng nên chịu được ma trận suy biến
+    values, vectors = np.linalg.eigh(np.nan_to_num(covs))
+    return vectors * np.sqrt(np.clip(values, 0, None))[..., None, :]
+
+
+def simulate_chunks(means, covs, prices, buying_prices, samples=DEFAULT_SAMPLES, seed=DEFAULT_SEED,
+                    max_elements=MAX_ELEMENTS):
+    # means (P, 2), covs (P, 2, 2), prices (P, G), buying_prices (P,).
+    # Sinh theo từng nhóm sản phẩm: (lát sản phẩm, số lượng (p, S, G), lợi nhuận (p, S, G))
+    means = np.asarray(means, dtype=float)
+    prices = np.asarray(prices, dtype=float)
+    margins = prices - np.asarray(buying_prices, dtype=float)[:, None]
+    factors = covariance_factors(np.asarray(covs, dtype=float))
+    z = np.random.default_rng(seed).standard_normal((samples, 2))
+    count, points = prices.shape
+    chunk = max(1, max_elements // (samples * points))
+    for start in range(0, count, chunk):
+        rows = slice(start, start + chunk)
+        betas = means[rows, None, :] + np.einsum('sk,pjk->psj', z, factors[rows])
+        # Q = a + bP, cắt về 0; tính tại chỗ để không tạo thêm mảng (p, S, G) tạm
+        quantities = np.multiply(betas[..., 1:], prices[rows, None, :])
+        quantities += betas[..., :1]
+        np.maximum(quantities, 0, out=quantities)
+        yield rows, quantities, margins[rows, None, :] * quantities
+
+
+def summarize(quantities, profits, quantiles=DEFAULT_QUANTILES):
+    # Thống kê theo trục mẫu (trục 1)
+    result = {
+        'EXPECTED_QUANTITY': quantities.mean(axis=1),
+        'EXPECTED_PROFIT': profits.mean(axis=1),
+        'STD_PROFIT': profits.std(axis=1),
+        'PROB_LOSS': (profits < 0).mean(axis=1),
+    }
+    for q, values in zip(quantiles, np.quantile(profits, quantiles, axis=1)):
+        result[quantile_column(q)] = values
+    return result
+
+
+def simulate(means, covs, prices, buying_prices, samples=DEFAULT_SAMPLES, quantiles=DEFAULT_QUANTILES,
+             seed=DEFAULT_SEED, max_elements=MAX_ELEMENTS):
+    # Thống kê đầy đủ tại mọi mức giá: dict các mảng (P, G)
+    parts = [(rows, summarize(quantities, profits, quantiles)) for rows, quantities, profits
+             in simulate_chunks(means, covs, prices, buying_prices, samples, seed, max_elements)]
+    return {name: np.concatenate([part[name] for _, part in parts]) for name in parts[0][1]}
+
+
+def price_grid(lows, highs, points=RISK_GRID_POINTS):
+    lows, highs = np.asarray(lows, dtype=float), np.asarray(highs, dtype=float)
+    return lows[:, None] + (highs - lows)[:, None] * np.linspace(0, 1, points)
+
+
+def _quantiles(quantiles, risk_quantile):
+    return tuple(sorted(set(quantiles) | {risk_quantile}))
+
+
+@instrument()
+def risk_profile(data, model, buying_price, bounds=None, samples=DEFAULT_SAMPLES, grid_points=RISK_GRID_POINTS,
+                 quantiles=DEFAULT_QUANTILES, seed=DEFAULT_SEED):
+    # Phân phối lợi nhuận tại từng mức giá của một sản phẩm: một dòng cho mỗi mức giá
+    mean, cov = linear_parameters(model)
+    low, high = bounds if bounds is not None else default_bounds(data, buying_price)
+    prices = price_grid([low], [high], grid_points)
+    result = simulate(mean[None], cov[None], prices, [buying_price], samples, quantiles, seed)
+    return pd.DataFrame({'PRICE': prices[0], **{name: values[0] for name, values in result.items()}})
+
+
+@instrument()
+def risk_portfolio(data, models, buying_prices, default_buying_price=9.0, samples=DEFAULT_SAMPLES,
+                   grid_points=RISK_GRID_POINTS, quantiles=DEFAULT_QUANTILES, risk_quantile=RISK_QUANTILE,
+                   seed=DEFAULT_SEED):
+    # Mỗi sản phẩm một dòng: giá tối đa lợi nhuận kỳ vọng (EXPECTED_PRICE) và giá điều chỉnh theo rủi ro
+    # (PRICE, tối đa phân vị risk_quantile), kèm phân phối lợi nhuận tại giá điều chỉnh.
+    # Mô hình không đúng dạng QUANTITY ~ PRICE cho dòng NaN.
+    if isinstance(data, ProductIndex):
+        data = data.data
+    keys = list(models)
+    costs = _buying_price_vector(keys, buying_prices, default_buying_price)
+    quantiles = _quantiles(quantiles, risk_quantile)
+    stats = sufficient_stats(data).reindex(pd.MultiIndex.from_tuples([split_product_key(key) for key in keys]))
+    has_data = (stats['N'].fillna(0) > 0).to_numpy()
+    lowest = np.where(has_data, stats['MIN_P'].to_numpy(), costs)
+    highest = np.where(has_data, stats['MAX_P'].to_numpy(), costs)
+    bounds = np.array([price_bounds(low, high, cost) for low, high, cost in zip(lowest, highest, costs)])
+
+    linear = np.array([linear_coefficients(models[key]) is not None for key in keys], dtype=bool)
+    columns = ['EXPECTED_PRICE', 'EXPECTED_PRICE_PROFIT', 'PRICE', 'EXPECTED_QUANTITY', 'EXPECTED_PROFIT',
+               'STD_PROFIT', 'PROB_LOSS'] + [quantile_column(q) for q in quantiles]
+    table = {name: np.full(len(keys), np.nan) for name in columns}
+    if linear.any():
+        parameters = [linear_parameters(models[key]) for key, is_linear in zip(keys, linear) if is_linear]
+        means = np.array([mean for mean, _ in parameters])
+        covs = np.array([cov for _, cov in parameters])
+        prices = price_grid(bounds[linear, 0], bounds[linear, 1], grid_points)
+        positions = np.flatnonzero(linear)
+        # Trên cả lưới chỉ cần lợi nhuận kỳ vọng và phân vị rủi ro; thống kê đầy đủ tính tại giá đã chọn
+        for rows, quantities, profits in simulate_chunks(means, covs, prices, costs[linear], samples, seed):
+            index = np.arange(profits.shape[0])
+            expected_profit = profits.mean(axis=1)
+            expected = np.argmax(expected_profit, axis=1)
+            chosen = np.argmax(np.quantile(profits, risk_quantile, axis=1), axis=1)
+            target = positions[rows]
+            table['EXPECTED_PRICE'][target] = prices[rows][index, expected]
+            table['EXPECTED_PRICE_PROFIT'][target] = expected_profit[index, expected]
+            table['PRICE'][target] = prices[rows][index, chosen]
+            summary = summarize(quantities[index, :, chosen][..., None], profits[index, :, chosen][..., None],
+                                quantiles)
+            for name, values in summary.items():
+                table[name][target] = values[:, 0]
+    return pd.DataFrame({'PRODUCT': keys, 'BUYING_PRICE': costs, **table})
+
+
+@instrument()
+def find_risk_adjusted_price(data, model, buying_price, bounds=None, samples=DEFAULT_SAMPLES,
+                             grid_points=RISK_GRID_POINTS, risk_quantile=RISK_QUANTILE, seed=DEFAULT_SEED):
+    # Như find_optimal_price nhưng chọn giá tối đa phân vị risk_quantile của lợi nhuận
+    profile = risk_profile(data, model, buying_price, bounds, samples, grid_points, (risk_quantile,), seed)
+    best = profile.loc[profile[quantile_column(risk_quantile)].idxmax()]
+    return pd.DataFrame({'PRICE': [float(best['PRICE'])],
+                         'QUANTITY': [float(best['EXPECTED_QUANTITY'])],
+                         'PROFIT': [float(best['EXPECTED_PROFIT'])],
+                         quantile_column(risk_quantile): [float(best[quantile_column(risk_quantile)])],
+                         'PROB_LOSS': [float(best['PROB_LOSS'])]})
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+from .CSV import day_numbers
+from .metrics import instrument
+from .products import ProductIndex, product_key
+from .regression import PRODUCT_COLUMNS, ols_from_sums
+
+# Độ co giãn theo cửa sổ thời gian trượt cho mọi sản phẩm cùng lúc. Dữ liệu được sắp theo
+# (sản phẩm, ngày) một lần, lấy tổng tích lũy của các thống kê đủ; tổng của mỗi cửa sổ là hiệu
+# hai vị trí tìm bằng searchsorted, nên cả chuỗi tốn O(n) thay vì một lần fit OLS cho mỗi cửa sổ.
+DEFAULT_WINDOW_DAYS = 90
+DEFAULT_STEP_DAYS = 30
+# Cửa sổ có ít ngày dữ liệu hơn thì để NaN
+MIN_WINDOW_OBSERVATIONS = 3
+ROLLING_COLUMNS = ['PRODUCT', 'ITEM_NAME', 'SELL_ID', 'WINDOW_START', 'WINDOW_END', 'N', 'MEAN_PRICE',
+                   'MEAN_QUANTITY', 'INTERCEPT', 'SLOPE', 'ELASTICITY']
+
+
+def window_starts(first_day, last_day, window_days, step_days):
+    # Lưới cửa sổ chung cho mọi sản phẩm; cửa sổ cuối kết thúc đúng ngày cuối nếu đủ dài
+    last_start = max(first_day, last_day - window_days + 1)
+    return np.arange(first_day, last_start + 1, step_days, dtype=np.int64)
+
+
+@instrument()
+def rolling_elasticity(data, window_days=DEFAULT_WINDOW_DAYS, step_days=DEFAULT_STEP_DAYS,
+                       min_observations=MIN_WINDOW_OBSERVATIONS):
+    # Một dòng cho mỗi (sản phẩm, cửa sổ [WINDOW_START, WINDOW_END]): hồi quy QUANTITY ~ PRICE trong cửa sổ.
+    # SLOPE là hệ số giá (như "Độ co giãn" của calculate_adjustment), ELASTICITY là độ co giãn
+    # tại điểm trung bình của cửa sổ: SLOPE * giá trung bình / số lượng trung bình.
+    if window_days < 1 or step_days < 1:
+        raise ValueError("Độ dài cửa sổ và bước trượt phải ít nhất 1 ngày")
+    if isinstance(data, ProductIndex):
+        data = data.data
+    if data.empty:
+        return pd.DataFrame(columns=ROLLING_COLUMNS)
+
+    grouped = data.groupby(PRODUCT_COLUMNS, observed=True, sort=False)
+    codes = grouped.ngroup().to_numpy()
+    products = list(grouped.groups)
+    days = day_numbers(data['CALENDAR_DATE'])
+    order = np.lexsort((days, codes))
+    codes, days = codes[order], days[order]
+    price = data['PRICE'].to_numpy(dtype=float)[order]
+    quantity = data['QUANTITY'].to_numpy(dtype=float)[order]
+
+    # Trừ trung bình theo sản phẩm trước khi cộng dồn để hiệu của hai tổng lớn không mất chính xác;
+    # hệ số góc không đổi khi dịch gốc, hệ số chặn được tính lại từ trung bình thật
+    center_p = np.bincount(codes, price) / np.bincount(codes)
+    center_q = np.bincount(codes, quantity) / np.bincount(codes)
+    p = price - center_p[codes]
+    q = quantity - center_q[codes]
+    cumulative = np.zeros((len(p) + 1, 5))
+    np.cumsum(np.column_stack([np.ones(len(p)), p, q, p * p, p * q]), axis=0, out=cumulative[1:])
+    # Số lần đổi giá tích lũy: cửa sổ giá không đổi cho tổng bình phương sai số làm tròn chứ không đúng
+    # bằng 0, nên nhận biết chính xác bằng việc có lần đổi giá nào trong cửa sổ hay không
+    changes = np.zeros(len(p) + 1)
+    changes[2:] = np.cumsum((codes[1:] == codes[:-1]) & (price[1:] != price[:-1]))
+
+    first_day, last_day = int(days.min()), int(days.max())
+    starts = window_starts(first_day, last_day, window_days, step_days)
+    # Khóa (sản phẩm, ngày) đã sắp xếp; mỗi cửa sổ của mỗi sản phẩm là một đoạn liên tiếp
+    span = last_day - first_day + window_days + 1
+    keys = codes * span + (days - first_day)
+    group_ids = np.repeat(np.arange(len(products)), len(starts))
+    window_ids = np.tile(starts, len(products))
+    offsets = group_ids * span + (window_ids - first_day)
+    lo, hi = np.searchsorted(keys, offsets), np.searchsorted(keys, offsets + window_days)
+    n, sum_p, sum_q, sum_pp, sum_pq = (cumulative[hi] - cumulative[lo]).T
+    varies = changes[hi] - changes[np.minimum(lo + 1, hi)] > 0
+
+    _, slope = ols_from_sums(n, sum_p, sum_q, sum_pp, sum_pq)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_price = sum_p / n + center_p[group_ids]
+        mean_quantity = sum_q / n + center_q[group_ids]
+        slope = np.where((n >= min_observations) & varies, slope, np.nan)
+        intercept = mean_quantity - slope * mean_price
+        elasticity = slope * mean_price / mean_quantity
+    items = [item for item, _ in products]
+    sell_ids = [int(sell_id) for _, sell_id in products]
+    return pd.DataFrame({
+        'PRODUCT': np.repeat([product_key(item, sell_id) for item, sell_id in products], len(starts)),
+        'ITEM_NAME': np.repeat(np.array(items, dtype=object), len(starts)),
+        'SELL_ID': np.repeat(sell_ids, len(starts)),
+        'WINDOW_START': window_ids.astype('datetime64[D]'),
+        'WINDOW_END': (window_ids + window_days - 1).astype('datetime64[D]'),
+        'N': n.astype(np.int64),
+        'MEAN_PRICE': mean_price,
+        'MEAN_QUANTITY': mean_quantity,
+        'INTERCEPT': intercept,
+        'SLOPE': slope,
+        'ELASTICITY': elasticity,
+    })
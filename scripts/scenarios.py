@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from .optimizer import _buying_price_vector, linear_coefficients, predict_quantities
+from .metrics import instrument
+from .products import ProductIndex, split_product_key
+from .regression import sufficient_stats
+
+# Mức giảm giá (%) giống biểu đồ "Tác động của Giảm giá"
+DEFAULT_DISCOUNTS = np.arange(0, 51, 5)
+
+
+def evaluate_schedule(model, prices, buying_price):
+    # Số lượng, doanh thu, lợi nhuận tại nhiều mức giá với một lần predict
+    prices = np.asarray(prices, dtype=float)
+    coefficients = linear_coefficients(model)
+    if coefficients is not None:
+        quantities = coefficients[0] + coefficients[1] * prices
+    else:
+        quantities = predict_quantities(model, prices.ravel()).reshape(prices.shape)
+    return quantities, prices * quantities, (prices - buying_price) * quantities
+
+
+@instrument(rows='result')
+def price_schedule_scenarios(models, prices, buying_prices=9.0, labels=None, default_buying_price=9.0):
+    # prices: mảng (số sản phẩm × số mức) theo thứ tự models, hoặc dict {khóa: mảng giá}.
+    # Trả về bảng dạng dài: PRODUCT, SCENARIO, PRICE, QUANTITY, REVENUE, PROFIT
+    keys = list(models)
+    if isinstance(prices, dict):
+        prices = np.array([prices[key] for key in keys], dtype=float)
+    prices = np.atleast_2d(np.asarray(prices, dtype=float))
+    levels = prices.shape[1]
+    labels = np.arange(levels) if labels is None else np.asarray(labels)
+    costs = _buying_price_vector(keys, buying_prices, default_buying_price)
+
+    # Mô hình QUANTITY ~ PRICE: tính cả ma trận một lần; mô hình khác: một predict mỗi sản phẩm
+    coefficients = [linear_coefficients(models[key]) for key in keys]
+    linear = np.array([c is not None for c in coefficients], dtype=bool)
+    quantities = np.empty_like(prices)
+    if linear.any():
+        intercepts, slopes = np.array([c for c in coefficients if c is not None]).T
+        quantities[linear] = intercepts[:, None] + slopes[:, None] * prices[linear]
+    for i in np.flatnonzero(~linear):
+        quantities[i] = predict_quantities(models[keys[i]], prices[i])
+
+    return pd.DataFrame({
+        'PRODUCT': np.repeat(keys, levels),
+        'SCENARIO': np.tile(labels, len(keys)),
+        'PRICE': prices.ravel(),
+        'QUANTITY': quantities.ravel(),
+        'REVENUE': (prices * quantities).ravel(),
+        'PROFIT': ((prices - costs[:, None]) * quantities).ravel(),
+    })
+
+
+@instrument()
+def discount_scenarios(data, models, discounts=DEFAULT_DISCOUNTS, buying_prices=9.0, default_buying_price=9.0):
+    # Quét các mức giảm giá (%) trên giá bán trung bình của từng sản phẩm, như analyze_discount
+    if isinstance(data, ProductIndex):
+        data = data.data
+    keys = list(models)
+    stats = sufficient_stats(data).reindex(pd.MultiIndex.from_tuples([split_product_key(key) for key in keys]))
+    current_price = (stats['SUM_P'] / stats['N']).to_numpy()
+    discounts = np.asarray(discounts, dtype=float)
+    prices = current_price[:, None] * (1 - discounts[None, :] / 100)
+    result = price_schedule_scenarios(models, prices, buying_prices, discounts, default_buying_price)
+    return result.rename(columns={'SCENARIO': 'DISCOUNT'})
@@ -0,0 +1,139 @@
+import glob
+import json
+import os
+import shutil
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from .CSV import CACHE_DIR, DATA_DIR, load_indexed_data, source_fingerprint, source_paths
+from .cache import data_fingerprint
+from .cube import SegmentCube
+from .registry import MANIFEST_PATH, current_registry_path, load_registry
+
+# Dữ liệu và mô hình nạp một lần cho cả tiến trình, dùng chung (chỉ đọc) giữa mọi phiên Streamlit.
+# Bảng có thể xuất thành các file .npy để tiến trình khác mở bằng mmap mà không sao chép.
+DataState = namedtuple('DataState', ['combined_index', 'bau2_index', 'models', 'cubes', 'fingerprints', 'source'])
+SHARED_META = 'meta.json'
+
+
+def source_key(data_dir=DATA_DIR, manifest_path=MANIFEST_PATH):
+    # Đổi khi file nguồn, phiên bản mô hình trong manifest hoặc file registry thay đổi; chỉ cần stat
+    registry_path = current_registry_path(manifest_path)
+    return source_fingerprint(source_paths(data_dir)), registry_path, os.stat(registry_path).st_mtime_ns
+
+
+class DataService:
+    # Giữ một DataState; refresh() được gọi mỗi lần rerun và chỉ nạp lại khi source_key đổi.
+    # Trạng thái mới được dựng xong rồi mới thay thế, phiên đang chạy vẫn dùng bản cũ đến hết lượt.
+
+    def __init__(self, data_dir=DATA_DIR, manifest_path=MANIFEST_PATH, typed=True):
+        self.data_dir = data_dir
+        self.manifest_path = manifest_path
+        self.typed = typed
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.state = None
+        self.reload()
+
+    def _load(self, key):
+        combined_index, bau2_index = load_indexed_data(self.data_dir, typed=self.typed)
+        combined_data, bau2_data = combined_index.data, bau2_index.data
+        return DataState(
+            combined_index=combined_index,
+            bau2_index=bau2_index,
+            # Registry chỉ chứa hệ số; mô hình được dựng khi truy cập lần đầu
+            models=load_registry(key[1]),
+            # Khối thống kê đủ theo phân khúc để tính hồi quy theo bộ lọc mà không cần fit lại
+            cubes={'combined': SegmentCube(combined_data), 'bau2': SegmentCube(bau2_data)},
+            # Dấu vân tay từng phân khúc làm khóa cho bộ đệm kết quả; kèm cả source_key (đường dẫn và
+            # mtime của registry) để ghi đè registry tại chỗ cũng làm các kết quả cũ trượt bộ đệm
+            fingerprints={'combined': data_fingerprint(combined_data, *key),
+                          'bau2': data_fingerprint(bau2_data, *key)},
+            source=key,
+        )
+
+    def reload(self):
+        # Nạp lại ngay, kể cả khi nguồn không đổi
+        with self._lock:
+            self.state = self._load(source_key(self.data_dir, self.manifest_path))
+            self.reloads += 1
+        return self.state
+
+    def refresh(self):
+        key = source_key(self.data_dir, self.manifest_path)
+        if key != self.state.source:
+            with self._lock:
+                # Phiên khác có thể vừa nạp lại trong lúc chờ khóa
+                if key != self.state.source:
+                    self.state = self._load(key)
+                    self.reloads += 1
+        return self.state
+
+    def export(self, directory=None):
+        # Xuất combined_data để các tiến trình con gắn vào bằng attach_frame
+        if directory:
+            return export_frame(self.state.combined_index.data, directory)
+        directory = export_frame(self.state.combined_index.data, shared_directory(self.data_dir, self.typed))
+        prune_shared(self.data_dir, self.typed)
+        return directory
+
+
+def shared_directory(data_dir=DATA_DIR, typed=False):
+    prefix = 'shared-typed' if typed else 'shared'
+    return os.path.join(data_dir, CACHE_DIR, f"{prefix}-{source_fingerprint(source_paths(data_dir))}")
+
+
+def prune_shared(data_dir=DATA_DIR, typed=False):
+    # Xóa các bản xuất của dữ liệu cũ cùng loại, chỉ giữ shared_directory hiện tại. So khớp đúng tiền tố
+    # vì 'shared-*' cũng khớp 'shared-typed-*'; tiến trình còn mmap file cũ vẫn đọc được sau khi xóa.
+    current = shared_directory(data_dir, typed)
+    prefix = os.path.basename(current).rsplit('-', 1)[0]
+    for path in glob.glob(os.path.join(os.path.dirname(current), f"{prefix}-*")):
+        if path != current and os.path.basename(path).rsplit('-', 1)[0] == prefix:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def export_frame(frame, directory):
+    # Mỗi cột một file .npy: cột số giữ nguyên kiểu, category lưu mã kèm nhãn trong meta.json,
+    # cột chuỗi lưu unicode cố định. meta.json ghi sau cùng nên có nó là bộ file đã đầy đủ.
+    os.makedirs(directory, exist_ok=True)
+    columns = []
+    for i, (name, series) in enumerate(frame.items()):
+        column = {'name': name, 'dtype': str(series.dtype), 'file': f"c{i}.npy"}
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            values = series.cat.codes.to_numpy()
+            column['categories'] = series.cat.categories.tolist()
+            column['categories_dtype'] = str(series.cat.categories.dtype)
+        else:
+            values = series.to_numpy()
+            if values.dtype == object or column['dtype'] == 'str':
+                values = values.astype(str)
+        np.save(os.path.join(directory, column['file']), values)
+        columns.append(column)
+    tmp_path = os.path.join(directory, f"{SHARED_META}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump({'rows': len(frame), 'columns': columns}, f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(directory, SHARED_META))
+    return directory
+
+
+def attach_frame(directory):
+    # Mở bảng đã xuất bằng mmap chỉ đọc: cột số và mã category dùng chung trang nhớ giữa các
+    # tiến trình (không sao chép); riêng cột chuỗi phải dựng lại thành đối tượng Python
+    with open(os.path.join(directory, SHARED_META)) as f:
+        meta = json.load(f)
+    data = {}
+    for column in meta['columns']:
+        values = np.load(os.path.join(directory, column['file']), mmap_mode='r').view(np.ndarray)
+        if 'categories' in column:
+            dtype = pd.CategoricalDtype(pd.Index(column['categories'], dtype=column['categories_dtype']))
+            data[column['name']] = pd.Series(pd.Categorical.from_codes(values, dtype=dtype, validate=False),
+                                             copy=False)
+        elif values.dtype.kind == 'U':
+            data[column['name']] = pd.Series(values.astype(object)).astype(column['dtype'])
+        else:
+            data[column['name']] = values
+    return pd.DataFrame(data, copy=False)
@@ -0,0 +1,149 @@
+import argparse
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .CSV import DATA_DIR, load_data, source_fingerprint, source_paths
+from .products import ProductIndex
+from .registry import (DEFAULT_SEGMENT, MANIFEST_PATH, LinearModel, check_exog_names, check_pricing_terms,
+                       new_version, publish_version, read_manifest, save_registry)
+
+# Huấn luyện lại mô hình cho mọi cặp (ITEM_NAME, SELL_ID) có trong dữ liệu:
+#   python -m scripts.train --segment both --workers 8
+# Mỗi lần chạy ghi models/registry-<phiên bản>-<phân khúc>.npz và thêm phiên bản vào
+# models/manifest.json; app.py và scripts.batch đọc phiên bản hiện tại từ manifest.
+SEGMENTS = ('combined', 'bau2')
+DEFAULT_FORMULA = 'QUANTITY ~ PRICE'
+# Sản phẩm có ít ngày dữ liệu hơn thì bỏ qua (hồi quy không xác định)
+MIN_OBSERVATIONS = 3
+
+
+def _fit_chunk(task):
+    # Chạy trong tiến trình con: fit OLS cho một phần danh sách sản phẩm
+    import statsmodels.formula.api as smf
+
+    formula, frames = task
+    models = {}
+    for key, frame in frames.items():
+        models[key] = LinearModel.from_results(smf.ols(formula, data=frame).fit())
+    return models
+
+
+def validate_formula(formula, data, pricing=True):
+    # Kiểm tra công thức trên vài dòng trước khi fit song song: phải phân tích được, lưu được vào
+    # registry và (khi pricing) dự đoán được chỉ từ PRICE. Trả về tên các biến hồi quy.
+    import statsmodels.formula.api as smf
+
+    frame = data.data if isinstance(data, ProductIndex) else data
+    try:
+        model = smf.ols(formula, data=frame.head(100))
+    except Exception as error:
+        # Lỗi của patsy kèm nhiều dòng chỉ vị trí; chỉ giữ dòng đầu
+        raise ValueError(f"Công thức '{formula}' không hợp lệ: {str(error).splitlines()[0]}") from None
+    check_exog_names(formula, model.exog_names)
+    if pricing:
+        try:
+            check_pricing_terms(formula, model.endog_names, model.exog_names)
+        except ValueError as error:
+            raise ValueError(f"{error}; dùng --no-activate để chỉ lưu phiên bản thử nghiệm") from None
+    return model.exog_names
+
+
+def build_tasks(index, keys, formula, chunks, columns):
+    # Mỗi tác vụ mang theo đúng các dòng và cột cần cho phần sản phẩm của nó
+    tasks = []
+    for chunk in np.array_split(np.array(keys, dtype=object), chunks):
+        if len(chunk):
+            tasks.append((formula, {key: index.product(key)[columns].reset_index(drop=True) for key in chunk}))
+    return tasks
+
+
+def fit_models(data, formula=DEFAULT_FORMULA, workers=None, min_observations=MIN_OBSERVATIONS):
+    # Trả về ({khóa: LinearModel}, [khóa bị bỏ qua]) theo thứ tự xuất hiện của sản phẩm
+    workers = workers or os.cpu_count() or 1
+    index = data if isinstance(data, ProductIndex) else ProductIndex(data)
+    keys = [key for key in index.keys() if len(index.rows(key)) >= min_observations]
+    skipped = [key for key in index.keys() if len(index.rows(key)) < min_observations]
+    terms = set(re.findall(r'\w+', formula))
+    columns = [column for column in index.data.columns if column in terms]
+    tasks = build_tasks(index, keys, formula, max(1, workers * 4), columns)
+    if workers == 1:
+        results = [_fit_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_fit_chunk, tasks))
+    models = {}
+    for result in results:
+        models.update(result)
+    return models, skipped
+
+
+def train(data_dir=DATA_DIR, manifest_path=MANIFEST_PATH, segments=(DEFAULT_SEGMENT,), formula=DEFAULT_FORMULA,
+          workers=None, version=None, activate=True, typed=True):
+    combined_data, bau2_data = load_data(data_dir, typed=typed)
+    frames = {'combined': combined_data, 'bau2': bau2_data}
+    # Phiên bản được đặt làm hiện tại phải đánh giá được trong app; công thức thử nghiệm khác
+    # chỉ được lưu với activate=False
+    validate_formula(formula, frames[segments[0]], pricing=activate)
+    manifest = read_manifest(manifest_path) or {'current': None, 'versions': []}
+    version = version or new_version(manifest)
+    if any(v['version'] == version for v in manifest['versions']):
+        raise ValueError(f"Phiên bản '{version}' đã có trong manifest")
+
+    models_dir = os.path.dirname(manifest_path)
+    entry = {
+        'version': version,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'formula': formula,
+        'data_fingerprint': source_fingerprint(source_paths(data_dir)),
+        'typed': typed,
+        'segments': {},
+    }
+    for segment in segments:
+        start = time.perf_counter()
+        models, skipped = fit_models(frames[segment], formula, workers)
+        file_name = f"registry-{version}-{segment}.npz"
+        save_registry(os.path.join(models_dir, file_name), models)
+        entry['segments'][segment] = {
+            'file': file_name,
+            'products': len(models),
+            'skipped': skipped,
+            'rows': len(frames[segment]),
+            'seconds': round(time.perf_counter() - start, 3),
+        }
+
+    publish_version(entry, manifest_path, activate)
+    return entry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Huấn luyện lại mô hình giá cho mọi sản phẩm")
+    parser.add_argument('--data-dir', default=DATA_DIR, help="Thư mục chứa 3 file CSV nguồn")
+    parser.add_argument('--manifest', default=MANIFEST_PATH, help="Manifest registry (cùng thư mục với registry)")
+    parser.add_argument('--segment', choices=SEGMENTS + ('both',), default=DEFAULT_SEGMENT,
+                        help="Dữ liệu huấn luyện (bau2 giống các mô hình gốc)")
+    parser.add_argument('--formula', default=DEFAULT_FORMULA, help="Công thức hồi quy statsmodels")
+    parser.add_argument('--workers', type=int, default=None, help="Số tiến trình (mặc định: số nhân CPU)")
+    parser.add_argument('--version', help="Tên phiên bản (mặc định: theo thời gian)")
+    parser.add_argument('--typed', action=argparse.BooleanOptionalAction, default=True,
+                        help="Huấn luyện trên bảng có kiểu như app.py (mặc định; giữ mọi dòng giao dịch). "
+                             "--no-typed dùng phép gộp theo chuỗi ngày cũ, mất các dòng có ngày ghi khác định dạng")
+    parser.add_argument('--no-activate', action='store_true', help="Chỉ ghi phiên bản, không đặt làm hiện tại")
+    args = parser.parse_args(argv)
+    segments = SEGMENTS if args.segment == 'both' else (args.segment,)
+    try:
+        entry = train(args.data_dir, args.manifest, segments, args.formula, args.workers, args.version,
+                      not args.no_activate, args.typed)
+    except ValueError as error:
+        parser.error(str(error))
+    for segment, info in entry['segments'].items():
+        print(f"[{segment}] {info['products']} mô hình, bỏ qua {len(info['skipped'])}, "
+              f"{info['seconds']}s -> {info['file']}")
+    print(f"Phiên bản {entry['version']}" + ("" if args.no_activate else " (đang dùng)"))
+
+
+if __name__ == '__main__':
+    main()
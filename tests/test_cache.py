@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+
+from scripts.cache import LRUCache, cached_combo, cached_portfolio, data_fingerprint
+from scripts.CSV import load_data
+from scripts.optimizer import optimize_combo, optimize_portfolio
+from scripts.registry import load_registry
+
+
+def test_lru_eviction_and_stats():
+    cache = LRUCache(maxsize=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    # 'b' là mục ít được dùng gần đây nhất nên bị loại khi thêm 'c'
+    cache.put('c', 3)
+    assert 'b' not in cache and 'a' in cache and 'c' in cache
+    assert cache.get('b', 'missing') == 'missing'
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'hits': 1, 'misses': 1, 'evictions': 1, 'hit_rate': 0.5}
+
+
+def test_get_or_compute_runs_once():
+    cache = LRUCache()
+    calls = []
+
+    def compute(value):
+        calls.append(value)
+        return value * 2
+
+    assert cache.get_or_compute('key', compute, 21) == 42
+    assert cache.get_or_compute('key', compute, 21) == 42
+    assert calls == [21]
+    # Giá trị None vẫn được đệm
+    assert cache.get_or_compute('none', lambda: None) is None
+    assert cache.get_or_compute('none', lambda: pytest.fail("tính lại")) is None
+
+
+def test_data_fingerprint():
+    frame = pd.DataFrame({'PRICE': [1.0, 2.0], 'QUANTITY': [3, 4]})
+    assert data_fingerprint(frame, 'a') == data_fingerprint(frame.copy(), 'a')
+    assert data_fingerprint(frame, 'a') != data_fingerprint(frame, 'b')
+    assert data_fingerprint(frame) != data_fingerprint(frame.assign(QUANTITY=[3, 5]))
+
+
+def test_cached_portfolio_matches_optimizer():
+    combined_data, _ = load_data('data', typed=True)
+    models = dict(load_registry('models/registry.npz'))
+    cache = LRUCache()
+    fingerprint = data_fingerprint(combined_data)
+    buying_prices = {key: 9.0 for key in models}
+    expected = optimize_portfolio(combined_data, models, buying_prices)
+    pd.testing.assert_frame_equal(cached_portfolio(cache, fingerprint, combined_data, models, buying_prices), expected)
+
+    # Chỉ sản phẩm đổi giá mua bị tính lại, kết quả vẫn như tính toàn bộ
+    changed = next(iter(models))
+    buying_prices[changed] = 10.5
+    result = cached_portfolio(cache, fingerprint, combined_data, models, buying_prices)
+    assert cache.misses == len(models) + 1
+    pd.testing.assert_frame_equal(result, optimize_portfolio(combined_data, models, buying_prices))
+
+
+def test_cached_combo_caches_errors():
+    combined_data, _ = load_data('data', typed=True)
+    models = dict(load_registry('models/registry.npz'))
+    combo = {key: models[key] for key in ('burger_2051', 'coke_2051')}
+    cache = LRUCache()
+    expected = optimize_combo(combo, 9.0, data=combined_data)
+    for _ in range(2):
+        pd.testing.assert_frame_equal(cached_combo(cache, 'fp', combo, {}, data=combined_data), expected)
+    # Tổng giá thấp hơn mọi mức giá đã bán: lỗi cũng được đệm, lần sau không tìm lại
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            cached_combo(cache, 'fp', combo, {}, max_total=1.0, data=combined_data)
+    assert cache.stats()['hits'] == 2 and len(cache) == 2
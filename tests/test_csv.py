@@ -0,0 +1,91 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.CSV import (CACHE_DIR, CATEGORY_COLUMNS, DATE_FORMAT, TRANSACTIONS_FILE, load_combined_data, load_data,
+                         load_snapshot, save_snapshot, sum_chunks)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    # Bản sao dữ liệu không kèm snapshot của thư mục gốc
+    shutil.copytree('data', tmp_path / 'data', ignore=shutil.ignore_patterns(CACHE_DIR))
+    return str(tmp_path / 'data')
+
+
+def snapshots(data_dir):
+    return sorted(os.listdir(os.path.join(data_dir, CACHE_DIR)))
+
+
+@pytest.mark.parametrize('typed', [False, True])
+def test_snapshot_round_trip(tmp_path, data_dir, typed):
+    combined_data = load_combined_data(data_dir, use_cache=False, typed=typed)
+    path = str(tmp_path / 'snapshot.npz')
+    save_snapshot(path, combined_data)
+    pd.testing.assert_frame_equal(load_snapshot(path), combined_data)
+
+
+@pytest.mark.parametrize('typed', [False, True])
+def test_snapshot_invalidation(data_dir, typed):
+    built = load_combined_data(data_dir, use_cache=False, typed=typed)
+    pd.testing.assert_frame_equal(load_combined_data(data_dir, typed=typed), built)
+    [first] = snapshots(data_dir)
+    pd.testing.assert_frame_equal(load_combined_data(data_dir, typed=typed), built)
+
+    # Đổi file nguồn: snapshot mới theo dấu vân tay mới, snapshot cũ bị xóa
+    source = os.path.join(data_dir, TRANSACTIONS_FILE)
+    mtime = os.stat(source).st_mtime_ns + 1_000_000_000
+    os.utime(source, ns=(mtime, mtime))
+    pd.testing.assert_frame_equal(load_combined_data(data_dir, typed=typed), built)
+    [second] = snapshots(data_dir)
+    assert second != first
+
+    # Snapshot hỏng (ghi dở) được bỏ qua và dựng lại
+    with open(os.path.join(data_dir, CACHE_DIR, second), 'wb') as f:
+        f.write(b'PK\x03\x04')
+    pd.testing.assert_frame_equal(load_combined_data(data_dir, typed=typed), built)
+    assert snapshots(data_dir) == [second]
+    pd.testing.assert_frame_equal(load_snapshot(os.path.join(data_dir, CACHE_DIR, second)), built)
+
+
+def test_typed_keeps_all_rows():
+    # Phép gộp theo chuỗi ngày mất các ngày mà hai file ghi khác định dạng; bảng có kiểu giữ đủ
+    combined_data, bau2_data = load_data('data')
+    typed_data, typed_bau2 = load_data('data', typed=True)
+    assert (len(combined_data), len(bau2_data)) == (6696, 3328)
+    assert (len(typed_data), len(typed_bau2)) == (10808, 4984)
+    assert list(typed_data.columns) == list(combined_data.columns)
+    assert typed_data['CALENDAR_DATE'].dtype.kind == 'M'
+    assert all(isinstance(typed_data[column].dtype, pd.CategoricalDtype) for column in CATEGORY_COLUMNS)
+
+    # Mọi dòng của bảng chuỗi có trong bảng có kiểu với cùng số lượng và giá
+    combined_data = combined_data.assign(CALENDAR_DATE=pd.to_datetime(combined_data['CALENDAR_DATE'],
+                                                                      format=DATE_FORMAT))
+    matched = combined_data.merge(typed_data.astype({'ITEM_NAME': str, 'PRICE': float}),
+                                  on=['SELL_ID', 'ITEM_NAME', 'CALENDAR_DATE'], suffixes=('', '_TYPED'))
+    assert len(matched) == len(combined_data)
+    assert (matched['QUANTITY'] == matched['QUANTITY_TYPED']).all()
+    np.testing.assert_allclose(matched['PRICE'], matched['PRICE_TYPED'], rtol=1e-6)
+
+
+def test_sum_chunks_matches_groupby():
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({'SELL_ID': rng.integers(0, 5, 5000), 'DAY': rng.integers(0, 300, 5000),
+                          'QUANTITY': rng.integers(0, 50, 5000)})
+    by = ['SELL_ID', 'DAY']
+    expected = frame.groupby(by).QUANTITY.sum().reset_index()
+    # Các khối lớn nhỏ khác nhau, khối đầu nhỏ để kết quả bị gộp lại nhiều lần
+    bounds = [0, 10, 400, 410, 2000, 2100, 5000]
+    parts = (frame.iloc[lo:hi].groupby(by).QUANTITY.sum().reset_index() for lo, hi in zip(bounds, bounds[1:]))
+    pd.testing.assert_frame_equal(sum_chunks(parts, by), expected)
+
+
+@pytest.mark.parametrize('typed', [False, True])
+def test_chunked_load_matches_full(data_dir, typed):
+    full = load_combined_data(data_dir, use_cache=False, typed=typed)
+    for chunksize in (500, 4096):
+        chunked = load_combined_data(data_dir, use_cache=False, typed=typed, chunksize=chunksize)
+        pd.testing.assert_frame_equal(chunked, full)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+import statsmodels.formula.api as smf
+
+from scripts.CSV import load_data
+from scripts.cube import SegmentCube
+from scripts.products import split_product_key
+
+FILTERS = [
+    {},
+    {'weekend': 0},
+    {'holiday': 'No Holiday', 'schoolbreak': 0},
+    {'holiday': 'No Holiday', 'weekend': 0, 'schoolbreak': 0, 'outdoor': 1},
+    {'weekend': 1, 'outdoor': 0},
+]
+COLUMNS = {'holiday': 'HOLIDAY', 'weekend': 'IS_WEEKEND', 'schoolbreak': 'IS_SCHOOLBREAK', 'outdoor': 'IS_OUTDOOR'}
+
+
+@pytest.fixture(scope='module', params=[False, True], ids=['combined', 'typed'])
+def combined_data(request):
+    return load_data('data', typed=request.param)[0]
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_query_matches_statsmodels(combined_data, filters):
+    cube = SegmentCube(combined_data)
+    for key in cube.keys():
+        item, sell_id = split_product_key(key)
+        mask = (combined_data['ITEM_NAME'] == item) & (combined_data['SELL_ID'] == sell_id)
+        for name, value in filters.items():
+            mask &= combined_data[COLUMNS[name]] == value
+        rows = combined_data[mask]
+        fit = cube.query(key, **filters)
+        assert fit['n'] == len(rows)
+        if rows['PRICE'].nunique() < 2:
+            assert np.isnan(fit['slope'])
+            continue
+        expected = smf.ols('QUANTITY ~ PRICE', data=rows).fit().params
+        np.testing.assert_allclose([fit['intercept'], fit['slope']], expected, rtol=1e-7)
+        assert fit['mean_price'] == pytest.approx(rows['PRICE'].mean())
+        assert fit['min_price'] == pytest.approx(rows['PRICE'].min())
+        assert fit['max_price'] == pytest.approx(rows['PRICE'].max())
+
+
+def test_query_without_rows(combined_data):
+    cube = SegmentCube(combined_data)
+    fit = cube.query(cube.keys()[0], holiday='No such holiday')
+    assert fit['n'] == 0 and np.isnan(fit['slope']) and np.isnan(fit['min_price'])
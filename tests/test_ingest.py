@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import generate
+from scripts.CSV import TRANSACTIONS_FILE, load_data
+from scripts.ingest import IncrementalStore, main
+from scripts.registry import current_registry_path, load_registry, read_manifest
+from scripts.train import fit_models
+
+
+def assert_same_models(models, expected):
+    assert sorted(models) == sorted(expected)
+    for key, model in expected.items():
+        np.testing.assert_allclose(models[key].params, model.params, rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(models[key].cov_params(), model.cov_params(), rtol=1e-7, atol=1e-9)
+
+
+def test_untyped_data_rejected():
+    combined_data, _ = load_data('data')
+    with pytest.raises(ValueError):
+        IncrementalStore(combined_data, 'data')
+
+
+@pytest.mark.parametrize('segment, position', [('bau', 1), ('all', 0)])
+def test_replay_matches_batch_fit(tmp_path, segment, position):
+    # Nạp lại file giao dịch theo từng lô vào kho rỗng phải cho đúng hệ số như fit cả bảng một lần
+    generate(tmp_path, n_days=120)
+    frames = load_data(tmp_path, use_cache=False, typed=True)
+    store = IncrementalStore(frames[0].iloc[:0], tmp_path, segment)
+    transactions = pd.read_csv(tmp_path / TRANSACTIONS_FILE, dtype={'CALENDAR_DATE': str})
+    for rows in np.array_split(np.arange(len(transactions)), 7):
+        store.append(transactions.iloc[rows])
+
+    expected, _ = fit_models(frames[position], workers=1)
+    assert_same_models(store.models(), expected)
+    replayed = store.combined_data() if segment == 'all' else store.bau_data()
+    assert len(replayed) == len(frames[position])
+    assert replayed['QUANTITY'].sum() == frames[position]['QUANTITY'].sum()
+
+
+@pytest.mark.parametrize('segment, position', [('bau', 1), ('all', 0)])
+def test_store_matches_batch_fit(segment, position):
+    # DateInfo thật ghi 3/1/13 hai lần nên load_data lặp các dòng của ngày đó; kho phải đếm y như vậy
+    frames = load_data('data', typed=True)
+    store = IncrementalStore(frames[0], 'data', segment)
+    expected, _ = fit_models(frames[position], workers=1)
+    assert_same_models(store.models(), expected)
+    replayed = store.combined_data() if segment == 'all' else store.bau_data()
+    assert len(replayed) == len(frames[position])
+
+
+def test_ingest_publishes_version(tmp_path):
+    # Dữ liệu nguồn chỉ có phần đầu; nạp phần còn lại qua CLI phải cho dữ liệu và mô hình như khi có đủ
+    data_dir, models_dir = tmp_path / 'data', tmp_path / 'models'
+    models_dir.mkdir()
+    generate(data_dir, n_days=120)
+    full, _ = load_data(data_dir, use_cache=False, typed=True)
+    source = data_dir / TRANSACTIONS_FILE
+    transactions = pd.read_csv(source, dtype={'CALENDAR_DATE': str})
+    split = len(transactions) * 2 // 3
+    transactions.iloc[:split].to_csv(source, index=False)
+    transactions.iloc[split:].to_csv(tmp_path / 'batch.csv', index=False)
+
+    manifest_path = str(models_dir / 'manifest.json')
+    main([str(tmp_path / 'batch.csv'), '--data-dir', str(data_dir), '--manifest', manifest_path,
+          '--segment', 'both', '--version', 'v1'])
+
+    assert read_manifest(manifest_path)['current'] == 'v1'
+    pd.testing.assert_frame_equal(pd.read_csv(source, dtype={'CALENDAR_DATE': str}), transactions)
+    combined_data, bau2_data = load_data(data_dir, typed=True)
+    pd.testing.assert_frame_equal(combined_data, full)
+    expected, _ = fit_models(bau2_data, workers=1)
+    assert_same_models(dict(load_registry(current_registry_path(manifest_path))), expected)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from scripts.optimizer import optimize_combo
+from scripts.registry import LinearModel
+
+
+def linear_model(intercept, slope):
+    return LinearModel('QUANTITY ~ PRICE', ['Intercept', 'PRICE'], [intercept, slope], np.eye(2))
+
+
+def combo(count):
+    # Các sản phẩm khác hệ số để nghiệm không đối xứng; khoảng giá rộng để ràng buộc tổng giá là ràng buộc duy nhất
+    models = {f"item{i}_1": linear_model(200.0 - 10 * i, -(5.0 + i)) for i in range(count)}
+    bounds = {key: (0.0, 40.0) for key in models}
+    return models, bounds
+
+
+def lagrange_prices(models, cost, total):
+    # Nghiệm giải tích: a + 2bP - bc = μ như nhau cho mọi sản phẩm, tổng giá bằng total
+    a = np.array([model.params['Intercept'] for model in models.values()])
+    b = np.array([model.params['PRICE'] for model in models.values()])
+    mu = (total - np.sum((b * cost - a) / (2 * b))) / np.sum(1 / (2 * b))
+    return (mu + b * cost - a) / (2 * b)
+
+
+@pytest.mark.parametrize('count', [2, 3, 5])
+@pytest.mark.parametrize('total', [40.0, 37.3, 41.17])
+def test_fixed_combo_total(count, total):
+    # min_total == max_total: cả lưới đầy đủ (≤ 3 sản phẩm) lẫn phân rã đối ngẫu phải tìm được nghiệm
+    total = total * count / 3
+    models, bounds = combo(count)
+    result = optimize_combo(models, 9.0, bounds=bounds, min_total=total, max_total=total)
+    assert result['PRICE'].sum() == pytest.approx(total, abs=1e-6)
+    np.testing.assert_allclose(result['PRICE'], lagrange_prices(models, 9.0, total), atol=0.05)
+
+
+def test_narrow_combo_total():
+    models, bounds = combo(5)
+    result = optimize_combo(models, 9.0, bounds=bounds, min_total=60.0, max_total=60.001)
+    assert 60.0 - 1e-9 <= result['PRICE'].sum() <= 60.001 + 1e-9
+
+
+def test_infeasible_combo_total():
+    models, bounds = combo(3)
+    with pytest.raises(ValueError):
+        optimize_combo(models, 9.0, bounds=bounds, min_total=200.0, max_total=200.0)
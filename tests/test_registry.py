@@ -0,0 +1,57 @@
+import glob
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.registry import LinearModel, convert_pickles, load_registry, save_registry
+
+PICKLES = sorted(glob.glob('models/*.pkl'))
+
+
+def test_convert_pickles_matches_statsmodels(tmp_path):
+    output = str(tmp_path / 'registry.npz')
+    convert_pickles(PICKLES, output)
+    registry = load_registry(output)
+    assert len(registry) == len(PICKLES)
+    prices = pd.DataFrame({'PRICE': np.linspace(8, 18, 11)})
+    for path in PICKLES:
+        with open(path, 'rb') as f:
+            results = pickle.load(f)
+        model = registry[path[len('models/'):-len('.pkl')]]
+        np.testing.assert_allclose(model.params, results.params)
+        np.testing.assert_allclose(model.cov_params(), results.cov_params())
+        assert model.nobs == results.nobs and model.df_resid == results.df_resid
+        np.testing.assert_allclose(model.predict(prices), results.predict(prices))
+
+
+def test_save_load_round_trip(tmp_path):
+    # Mô hình khác số hệ số trong cùng registry: phần thừa của mảng được bỏ khi đọc lại
+    models = {
+        'burger_1070': LinearModel('QUANTITY ~ PRICE', ['Intercept', 'PRICE'], [150.0, -6.0],
+                                   [[4.0, -0.3], [-0.3, 0.03]], nobs=120, scale=9.0, df_resid=118),
+        'coke_2051': LinearModel('QUANTITY ~ PRICE - 1', ['PRICE'], [3.5], [[0.01]]),
+    }
+    path = str(tmp_path / 'registry.npz')
+    save_registry(path, models)
+    registry = load_registry(path)
+    assert list(registry) == list(models)
+    for key, model in models.items():
+        assert registry[key].formula == model.formula
+        assert registry[key].exog_names == model.exog_names
+        np.testing.assert_array_equal(registry[key].params, model.params)
+        np.testing.assert_array_equal(registry[key].cov_params(), model.cov_params())
+    assert registry['burger_1070'].nobs == 120
+    assert np.isnan(registry['coke_2051'].nobs)
+    assert registry['coke_2051'].predict(10.0) == pytest.approx([35.0])
+
+
+def test_pickled_registry_keeps_path_only(tmp_path):
+    path = str(tmp_path / 'registry.npz')
+    convert_pickles(PICKLES, path)
+    registry = load_registry(path)
+    registry['burger_1070']
+    restored = pickle.loads(pickle.dumps(registry))
+    assert restored.path == path and restored._arrays is None
+    np.testing.assert_array_equal(restored['burger_1070'].params, registry['burger_1070'].params)
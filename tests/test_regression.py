@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import statsmodels.formula.api as smf
+
+from scripts.CSV import load_data
+from scripts.regression import ols_from_sums, sufficient_stats
+
+
+def test_ols_from_sums_matches_statsmodels():
+    rng = np.random.default_rng(0)
+    price = rng.uniform(10, 16, 200)
+    quantity = 120 - 4.5 * price + rng.normal(0, 3, 200)
+    intercept, slope = ols_from_sums(len(price), price.sum(), quantity.sum(), price @ price, price @ quantity)
+    expected = smf.ols('QUANTITY ~ PRICE', data=pd.DataFrame({'PRICE': price, 'QUANTITY': quantity})).fit().params
+    assert np.isclose(intercept, expected['Intercept'], rtol=1e-9)
+    assert np.isclose(slope, expected['PRICE'], rtol=1e-9)
+
+
+def test_ols_from_sums_undetermined():
+    # Giá không đổi hoặc ít hơn 2 điểm: hồi quy không xác định nên trả NaN thay vì số vô nghĩa
+    intercept, slope = ols_from_sums([5, 1, 0], [60.0, 12.0, 0.0], [100.0, 20.0, 0.0], [720.0, 144.0, 0.0],
+                                     [1200.0, 240.0, 0.0])
+    assert np.isnan(slope).all() and np.isnan(intercept).all()
+
+
+def test_sufficient_stats_by_product():
+    # Thống kê đủ theo sản phẩm cho cùng hệ số như fit statsmodels trên từng sản phẩm
+    _, bau2_data = load_data('data', typed=True)
+    stats = sufficient_stats(bau2_data)
+    intercepts, slopes = ols_from_sums(stats['N'], stats['SUM_P'], stats['SUM_Q'], stats['SUM_PP'], stats['SUM_PQ'])
+    for (item, sell_id), intercept, slope in zip(stats.index, intercepts, slopes):
+        rows = bau2_data[(bau2_data['ITEM_NAME'] == item) & (bau2_data['SELL_ID'] == sell_id)]
+        expected = smf.ols('QUANTITY ~ PRICE', data=rows).fit().params
+        np.testing.assert_allclose([intercept, slope], expected, rtol=1e-8)
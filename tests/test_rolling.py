@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from scripts.CSV import load_data
+from scripts.products import split_product_key
+from scripts.rolling import rolling_elasticity
+
+
+@pytest.mark.parametrize('typed, window_days, step_days', [(True, 90, 30), (True, 30, 7), (False, 60, 45)])
+def test_rolling_matches_direct_fits(typed, window_days, step_days):
+    combined_data, _ = load_data('data', typed=typed)
+    series = rolling_elasticity(combined_data, window_days, step_days)
+    dates = pd.to_datetime(combined_data['CALENDAR_DATE'], format='%m/%d/%y')
+    assert series['PRODUCT'].nunique() == combined_data.groupby(['ITEM_NAME', 'SELL_ID'], observed=True).ngroups
+    assert (series['WINDOW_END'] - series['WINDOW_START'] == pd.Timedelta(days=window_days - 1)).all()
+    for row in series.itertuples():
+        item, sell_id = split_product_key(row.PRODUCT)
+        mask = ((combined_data['ITEM_NAME'] == item) & (combined_data['SELL_ID'] == sell_id) &
+                (dates >= row.WINDOW_START) & (dates <= row.WINDOW_END)).to_numpy()
+        price = combined_data['PRICE'].to_numpy(dtype=float)[mask]
+        quantity = combined_data['QUANTITY'].to_numpy(dtype=float)[mask]
+        assert row.N == len(price)
+        if len(price) < 3 or np.ptp(price) == 0:
+            assert np.isnan(row.SLOPE)
+            continue
+        slope, intercept = np.polyfit(price, quantity, 1)
+        assert row.SLOPE == pytest.approx(slope, rel=1e-6, abs=1e-9)
+        assert row.INTERCEPT == pytest.approx(intercept, rel=1e-6, abs=1e-6)
+        assert row.ELASTICITY == pytest.approx(slope * price.mean() / quantity.mean(), rel=1e-6, abs=1e-9)
+
+
+def test_rolling_rejects_bad_window():
+    combined_data, _ = load_data('data', typed=True)
+    with pytest.raises(ValueError):
+        rolling_elasticity(combined_data, window_days=0)
@@ -0,0 +1,72 @@
+import json
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+from scripts.CSV import load_data
+from scripts.cache import LRUCache, cached_portfolio
+from scripts.registry import LinearModel, load_registry, save_registry
+from scripts.service import DataService, attach_frame, export_frame
+
+
+def service_copy(tmp_path):
+    # Bản sao dữ liệu và registry trong thư mục tạm, manifest trỏ tới registry đó
+    data_dir = tmp_path / 'data'
+    shutil.copytree('data', data_dir, ignore=shutil.ignore_patterns('.cache'))
+    models_dir = tmp_path / 'models'
+    models_dir.mkdir()
+    shutil.copy('models/registry.npz', models_dir / 'registry.npz')
+    manifest_path = models_dir / 'manifest.json'
+    manifest_path.write_text(json.dumps({'current': 'v1', 'versions': [
+        {'version': 'v1', 'segments': {'bau2': {'file': 'registry.npz'}}}]}))
+    return DataService(str(data_dir), str(manifest_path)), models_dir / 'registry.npz'
+
+
+def test_rewritten_registry_misses_cache(tmp_path):
+    service, registry_path = service_copy(tmp_path)
+    state = service.state
+    models = dict(state.models)
+    cache = LRUCache()
+    before = cached_portfolio(cache, state.fingerprints['combined'], state.combined_index.data, models, {})
+    cached_portfolio(cache, state.fingerprints['combined'], state.combined_index.data, models, {})
+    assert cache.misses == len(models)
+
+    # Ghi đè registry tại chỗ (cùng đường dẫn, cùng phiên bản trong manifest) với hệ số khác
+    shifted = {key: LinearModel(model.formula, model.exog_names, model.params + [5.0, 0.0], model.cov_params())
+               for key, model in load_registry(str(registry_path)).items()}
+    save_registry(str(registry_path), shifted)
+    # Đẩy mtime lên để không phụ thuộc độ phân giải thời gian của hệ thống file
+    mtime = os.stat(registry_path).st_mtime_ns + 1_000_000_000
+    os.utime(registry_path, ns=(mtime, mtime))
+
+    state = service.refresh()
+    assert service.reloads == 2
+    after = cached_portfolio(cache, state.fingerprints['combined'], state.combined_index.data, dict(state.models), {})
+    assert cache.misses == 2 * len(models)
+    assert (after['PRICE'] != before['PRICE']).any()
+
+
+def test_export_prunes_stale_shared(tmp_path):
+    service, _ = service_copy(tmp_path)
+    cache_dir = tmp_path / 'data' / '.cache'
+    for name in ['shared-0123456789abcdef', 'shared-typed-0123456789abcdef']:
+        (cache_dir / name).mkdir(parents=True)
+    directory = service.export()
+    # Chỉ bản typed cũ bị xóa; bản không typed cũ là của loại khác nên giữ nguyên
+    assert sorted(path.name for path in cache_dir.glob('shared-*')) == sorted([
+        'shared-0123456789abcdef', os.path.basename(directory)])
+
+
+@pytest.mark.parametrize('typed', [False, True])
+def test_export_attach_round_trip(tmp_path, typed):
+    combined_data, _ = load_data('data', typed=typed)
+    directory = export_frame(combined_data, str(tmp_path / 'shared'))
+    pd.testing.assert_frame_equal(attach_frame(directory), combined_data)
+
+
+def test_refresh_without_changes(tmp_path):
+    service, _ = service_copy(tmp_path)
+    state = service.state
+    assert service.refresh() is state and service.reloads == 1